@@ -0,0 +1,110 @@
+# batch_recognize.py
+import argparse
+import glob
+import json
+import multiprocessing
+import os
+import sys
+import time
+import cv2
+
+from template_matcher import TemplateMatcher
+from solver import Solver
+from calibration import CalibrationProfile, PROFILE_FILE
+from layout import load_layout, LAYOUT_FILE
+
+IMAGE_EXTS = (".png", ".jpg", ".jpeg", ".bmp")
+
+# Per-process state, filled once by _init_worker
+_matcher = None
+_solver = None
+_options = None
+
+def _init_worker(templates_file, layout, with_moves, prescale=False):
+    global _matcher, _solver, _options
+    # Each pool process loads the template store exactly once
+    _matcher = TemplateMatcher(templates_file=templates_file, dont_save_unknowns=True, verbose=False)
+    _solver = Solver(target_sum=10) if with_moves else None
+    if prescale:
+        _matcher.set_feature_size(layout.feature_size)
+    _options = {"layout": layout}
+
+def crop_board(img, region):
+    """Cut the board region out of a full-monitor screenshot, images already of board size are kept as is"""
+    x, y, w, h = region
+    if img.shape[0] == h and img.shape[1] == w:
+        return img
+    if img.shape[0] < y + h or img.shape[1] < x + w:
+        raise ValueError(f"圖片尺寸 {img.shape[1]}x{img.shape[0]} 小於盤面區域 {region}")
+    return img[y:y + h, x:x + w]
+
+def recognize_file(path):
+    """Worker function: path -> result dict (errors are reported, not raised)"""
+    result = {"path": path}
+    try:
+        img = cv2.imread(path)
+        if img is None:
+            raise ValueError("無法讀取圖片")
+        layout = _options["layout"]
+        grid = _matcher.recognize_grid(crop_board(img, layout.region), layout=layout)
+        result["grid"] = grid
+        result["recognized"] = sum(1 for row in grid for v in row if v != 0)
+        if _solver is not None:
+            result["moves"] = [list(m) for m in _solver.find_all_moves(grid)]
+    except Exception as e:
+        result["error"] = str(e)
+    return result
+
+def collect_paths(inputs):
+    paths = []
+    for item in inputs:
+        if os.path.isdir(item):
+            for name in sorted(os.listdir(item)):
+                if name.lower().endswith(IMAGE_EXTS):
+                    paths.append(os.path.join(item, name))
+        else:
+            paths.extend(sorted(glob.glob(item)))
+    return paths
+
+def main():
+    parser = argparse.ArgumentParser(description="批次辨識截圖資料夾，結果以 JSON lines 依輸入順序輸出")
+    parser.add_argument("inputs", nargs="+", help="資料夾或 glob，例如 shots/ 或 'shots/*.png'")
+    parser.add_argument("--templates", default="digits.pkl")
+    parser.add_argument("--layout", help="版面名稱 (layouts.yaml，預設為檔案中的 default)")
+    parser.add_argument("--region", help="盤面區域 x,y,w,h (預設使用校正檔，沒有校正檔時為版面的 region)")
+    parser.add_argument("--calibration", default=PROFILE_FILE, help="校正檔路徑")
+    parser.add_argument("--moves", action="store_true", help="同時輸出 Solver.find_all_moves 的結果")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="行程數")
+    parser.add_argument("--chunksize", type=int, default=8, help="每次分派給行程的圖片數")
+    parser.add_argument("--out", help="輸出檔案 (預設為標準輸出)")
+    args = parser.parse_args()
+
+    paths = collect_paths(args.inputs)
+    if not paths:
+        parser.error("找不到任何圖片")
+    profile = None if args.region else CalibrationProfile.load(args.calibration)
+    try:
+        region = tuple(int(v) for v in args.region.split(",")) if args.region else None
+        layout = load_layout(args.layout, LAYOUT_FILE, profile=profile, region=region)
+    except ValueError as e:
+        parser.error(str(e))
+
+    out = open(args.out, "w", encoding="utf-8") if args.out else sys.stdout
+    start = time.perf_counter()
+    errors = 0
+    with multiprocessing.Pool(args.workers, initializer=_init_worker,
+                              initargs=(args.templates, layout, args.moves, profile is not None)) as pool:
+        # imap keeps the input order while the pool works ahead
+        for i, result in enumerate(pool.imap(recognize_file, paths, chunksize=args.chunksize), 1):
+            out.write(json.dumps(result, ensure_ascii=False) + "\n")
+            errors += "error" in result
+            if i % 100 == 0 or i == len(paths):
+                elapsed = time.perf_counter() - start
+                print(f"\r進度 {i}/{len(paths)}  {i / elapsed * 60:.0f} 張/分鐘  錯誤 {errors}",
+                      end="", file=sys.stderr, flush=True)
+    print(file=sys.stderr)
+    if args.out:
+        out.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,220 @@
+# benchmark.py
+import argparse
+import ast
+import json
+import time
+import cv2
+import numpy as np
+
+from screen_shot import CaptureSource, ReplaySource
+from template_matcher import TemplateMatcher
+from solver import Solver
+from metrics import Metrics
+from pipeline import BoardPipeline
+from synthetic_board import BoardRenderer, SyntheticSource
+from layout import GridLayout
+
+STAGES = ("capture", "gray", "diff", "ocr", "solve", "predict")
+
+class StillSource(CaptureSource):
+    def __init__(self, img, layout, frames=500, change_every=10, seed=0):
+        """
+        Synthetic sequence built from one board image: every change_every frames two random
+        cells swap places, the frames in between are identical copies
+        """
+        self.frame = img.copy()
+        self.layout = layout
+        self.rows, self.cols = layout.rows, layout.cols
+        self.frames = frames
+        self.change_every = change_every
+        self.rng = np.random.default_rng(seed)
+        self.index = 0
+
+    def capture(self):
+        if self.index >= self.frames:
+            raise EOFError
+        if self.index > 0 and self.change_every and self.index % self.change_every == 0:
+            (r1, r2), (c1, c2) = self.rng.integers(0, self.rows, 2), self.rng.integers(0, self.cols, 2)
+            a = self.layout.cell(self.frame, r1, c1)
+            b = self.layout.cell(self.frame, r2, c2)
+            tmp = a.copy()
+            a[:] = b
+            b[:] = tmp
+        self.index += 1
+        return self.frame
+
+def parse_config(text):
+    """
+    "diff_threshold=3,solver.target_sum=10" -> {"diff_threshold": 3, "solver.target_sum": 10}
+    Keys without prefix go to BoardPipeline, "matcher." / "solver." keys to those constructors
+    """
+    config = {}
+    if not text:
+        return config
+    for item in text.split(","):
+        key, value = item.split("=", 1)
+        try:
+            value = ast.literal_eval(value.strip())
+        except (ValueError, SyntaxError):
+            value = value.strip()
+        config[key.strip()] = value
+    return config
+
+def split_config(config):
+    pipeline_kw, matcher_kw, solver_kw = {}, {}, {}
+    for key, value in config.items():
+        if key.startswith("matcher."):
+            matcher_kw[key[len("matcher."):]] = value
+        elif key.startswith("solver."):
+            solver_kw[key[len("solver."):]] = value
+        else:
+            pipeline_kw[key] = value
+    return pipeline_kw, matcher_kw, solver_kw
+
+def run_config(make_source, config, templates_file, layout, matcher_cache, solver_cache_file=None):
+    """
+    Run one full pass of the sequence, return the report dict
+    solver_cache_file: str, Solver cache loaded before and saved after the run (needs solver.cache_size)
+    """
+    pipeline_kw, matcher_kw, solver_kw = split_config(config)
+    matcher_kw.setdefault("templates_file", templates_file)
+    matcher_kw.setdefault("dont_save_unknowns", True)
+
+    # Templates are loaded once per distinct matcher configuration
+    key = json.dumps(matcher_kw, sort_keys=True)
+    if key not in matcher_cache:
+        matcher_cache[key] = TemplateMatcher(**matcher_kw)
+    matcher = matcher_cache[key]
+    solver = Solver(**solver_kw)
+    if solver.cache is not None and solver_cache_file:
+        solver.cache.load(solver_cache_file)
+
+    # Single thread, so thread_time gives the CPU time of each stage
+    metrics = Metrics(enabled=True, window=100000, clock=time.thread_time)
+    pipeline = BoardPipeline(matcher, solver, layout=layout, metrics=metrics, **pipeline_kw)
+
+    source = make_source()
+    labelled = isinstance(source, SyntheticSource)
+    correct = total = 0
+    latencies = []
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+    while True:
+        start = time.perf_counter()
+        t = metrics.clock()
+        try:
+            img = source.capture()
+        except EOFError:
+            break
+        metrics.record("capture", t)
+        pipeline.process(img, now=start)
+        latencies.append(time.perf_counter() - start)
+
+        if labelled:
+            # Only cells that are neither animating nor waiting to settle are expected to be right
+            mask = ~source.animating & ~pipeline.tracker.unsettled
+            correct += int((pipeline.current_grid[mask] == source.grid[mask]).sum())
+            total += int(mask.sum())
+    wall = time.perf_counter() - wall_start
+    cpu = time.process_time() - cpu_start
+    source.close()
+    if solver.cache is not None and solver_cache_file:
+        solver.cache.save(solver_cache_file)
+
+    snap = metrics.snapshot()
+    lat = np.array(latencies) if latencies else np.zeros(1)
+    stages = {}
+    for name in STAGES:
+        h = snap["histograms"].get(name)
+        if h:
+            stages[name] = {"cpu_total": h["mean"] * h["count"], "mean": h["mean"], "p95": h["p95"]}
+    return {
+        "config": config,
+        "frames": len(latencies),
+        "fps": len(latencies) / wall if wall > 0 else 0.0,
+        "cpu_seconds": cpu,
+        "latency_p50": float(np.percentile(lat, 50)),
+        "latency_p95": float(np.percentile(lat, 95)),
+        "latency_p99": float(np.percentile(lat, 99)),
+        "ocr_calls": pipeline.ocr_count,
+        "skip_rate": pipeline.frame_gate.skip_rate,
+        "prediction_hits": snap["counters"].get("prediction_hits", 0),
+        "prediction_misses": snap["counters"].get("prediction_misses", 0),
+        "solver_cache": solver.cache.stats() if solver.cache is not None else None,
+        "accuracy": correct / total if total else None,
+        "stages": stages,
+    }
+
+def print_report(report):
+    name = ",".join(f"{k}={v}" for k, v in report["config"].items()) or "(預設)"
+    print(f"\n=== {name} ===")
+    print(f"影格數: {report['frames']}  FPS: {report['fps']:.1f}  CPU: {report['cpu_seconds']:.2f} s")
+    print(f"延遲 p50/p95/p99: {report['latency_p50'] * 1000:.2f} / "
+          f"{report['latency_p95'] * 1000:.2f} / {report['latency_p99'] * 1000:.2f} ms")
+    print(f"OCR 次數: {report['ocr_calls']}  略過比例: {report['skip_rate']:.2f}  "
+          f"預測命中/失誤: {report['prediction_hits']}/{report['prediction_misses']}")
+    if report["solver_cache"] is not None:
+        cache = report["solver_cache"]
+        print(f"求解快取: 命中率 {cache['hit_rate'] * 100:.1f}%  ({cache['hits']}/{cache['hits'] + cache['misses']})"
+              f"  大小 {cache['size']}/{cache['capacity']}")
+    if report["accuracy"] is not None:
+        print(f"辨識正確率: {report['accuracy'] * 100:.2f}%")
+    for stage, s in report["stages"].items():
+        print(f"  {stage:8s} CPU 合計 {s['cpu_total'] * 1000:9.1f} ms  平均 {s['mean'] * 1000:7.3f} ms  p95 {s['p95'] * 1000:7.3f} ms")
+
+def main():
+    parser = argparse.ArgumentParser(description="整體流程效能測試 (擷取 -> 差異 -> 辨識 -> 求解)，不需要 Qt")
+    parser.add_argument("--replay", help="FrameRecorder 錄影檔名稱 (不含副檔名)")
+    parser.add_argument("--image", help="單張盤面截圖，產生合成影格序列")
+    parser.add_argument("--frames", type=int, default=500, help="合成序列的影格數")
+    parser.add_argument("--change-every", type=int, default=10, help="合成序列每隔幾格交換兩個格子")
+    parser.add_argument("--synthetic", action="store_true", help="用模板合成盤面並模擬消除 (有標準答案，會回報正確率)")
+    parser.add_argument("--noise", type=float, default=0.0, help="合成盤面的雜訊強度")
+    parser.add_argument("--region", help="從截圖裁切盤面 x,y,w,h (預設整張即為盤面)")
+    parser.add_argument("--rows", type=int, default=14)
+    parser.add_argument("--cols", type=int, default=8)
+    parser.add_argument("--templates", default="digits.pkl")
+    parser.add_argument("--config", action="append", default=[],
+                        help="要比較的設定，例如 diff_threshold=3,gate_tolerance=4 (可重複)")
+    parser.add_argument("--json", help="將結果寫入 JSON 檔")
+    parser.add_argument("--solver-cache", help="求解快取檔: 執行前載入、結束後儲存 (需搭配 --config solver.cache_size=N)")
+    args = parser.parse_args()
+
+    if args.replay:
+        probe = ReplaySource(args.replay)
+        h, w = probe.frames.shape[1:3]
+        probe.close()
+        make_source = lambda: ReplaySource(args.replay, realtime=False)
+    elif args.image:
+        img = cv2.imread(args.image)
+        if img is None:
+            parser.error(f"無法讀取圖片: {args.image}")
+        if args.region:
+            x, y, w, h = (int(v) for v in args.region.split(","))
+            img = img[y:y + h, x:x + w]
+        h, w = img.shape[:2]
+        make_source = lambda: StillSource(img, layout, args.frames, args.change_every)
+    elif args.synthetic:
+        w, h = 480, 830
+        glyphs = TemplateMatcher(templates_file=args.templates, dont_save_unknowns=True).templates
+        make_source = lambda: SyntheticSource(
+            BoardRenderer(glyphs, layout=layout), Solver(10),
+            frames=args.frames, refill=True, noise=args.noise)
+    else:
+        parser.error("需要 --replay、--image 或 --synthetic")
+
+    layout = GridLayout(args.rows, args.cols, (0, 0, w, h))
+    configs = [parse_config(c) for c in args.config] or [{}]
+    matcher_cache = {}
+    reports = []
+    for config in configs:
+        report = run_config(make_source, config, args.templates, layout, matcher_cache, args.solver_cache)
+        print_report(report)
+        reports.append(report)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(reports, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,212 @@
+# calibration.py
+import json
+import math
+import os
+import cv2
+import numpy as np
+
+from layout import GridLayout, DEFAULT_CROP
+
+PROFILE_FILE = "calibration.json"
+DIGIT_THRESHOLD = 170  # Same binarization as TemplateMatcher.preprocess_cell_img
+
+class CalibrationProfile:
+    def __init__(self, monitor_id, region, rows, cols, origin=(0.0, 0.0), pitch=None):
+        """
+        Exact board geometry measured by calibrate()
+        region: tuple (x, y, w, h), Integer capture box relative to the monitor
+        origin: tuple (x, y), Sub-pixel top-left corner of the grid inside region
+        pitch: tuple (w, h), Sub-pixel cell size, default is region size / cols, rows
+        """
+        self.monitor_id = monitor_id
+        self.region = tuple(int(v) for v in region)
+        self.rows, self.cols = rows, cols
+        self.origin = (float(origin[0]), float(origin[1]))
+        if pitch is None:
+            pitch = (self.region[2] / cols, self.region[3] / rows)
+        self.pitch = (float(pitch[0]), float(pitch[1]))
+
+    def to_dict(self):
+        return {
+            "monitor_id": self.monitor_id,
+            "region": list(self.region),
+            "rows": self.rows,
+            "cols": self.cols,
+            "origin": list(self.origin),
+            "pitch": list(self.pitch),
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["monitor_id"], data["region"], data["rows"], data["cols"],
+                   origin=data.get("origin", (0.0, 0.0)), pitch=data.get("pitch"))
+
+    def save(self, path=PROFILE_FILE):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+    @classmethod
+    def load(cls, path=PROFILE_FILE):
+        """return: CalibrationProfile, or None if the file does not exist"""
+        if not path or not os.path.exists(path):
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            return cls.from_dict(json.load(f))
+
+def _glyph_boxes(gray):
+    """Bounding boxes (x, y, w, h) of bright blobs that could be digits"""
+    binary = (gray > DIGIT_THRESHOLD).astype(np.uint8)
+    n, _, stats, _ = cv2.connectedComponentsWithStats(binary, connectivity=8)
+    boxes = stats[1:, :4]
+    area = stats[1:, 4]
+    keep = (boxes[:, 3] >= 8) & (boxes[:, 3] <= 200) & (boxes[:, 2] >= 2) & (area >= 15)
+    boxes = boxes[keep]
+    if len(boxes) == 0:
+        return boxes
+    # Digits share one height, keep the largest group of similar heights (drops UI text, icons)
+    heights = boxes[:, 3]
+    best_h, best_count = 0, 0
+    for h in np.unique(heights):
+        count = int((np.abs(heights - h) <= 0.2 * h).sum())
+        if count >= best_count:
+            best_h, best_count = h, count
+    return boxes[np.abs(heights - best_h) <= 0.2 * best_h]
+
+def _cluster(values, tol):
+    """1D clusters of sorted values: list of (mean, count)"""
+    order = np.sort(values)
+    clusters = []
+    start = 0
+    for i in range(1, len(order) + 1):
+        if i == len(order) or order[i] - order[i - 1] > tol:
+            part = order[start:i]
+            clusters.append((float(part.mean()), len(part)))
+            start = i
+    return clusters
+
+def _fit_lattice(centers, n, tol):
+    """
+    Find n (>= 2) evenly spaced clusters among the blob centers of one axis
+    return: (first_center, pitch) of the least squares fit, None if there is no such run
+    """
+    clusters = _cluster(centers, tol)
+    best = None
+    for i in range(len(clusters) - n + 1):
+        run = clusters[i:i + n]
+        pos = np.array([m for m, _ in run])
+        weight = np.array([k for _, k in run], dtype=np.float64)
+        gaps = np.diff(pos)
+        if (gaps.min() <= 0 or np.abs(gaps - np.median(gaps)).max() > 0.2 * np.median(gaps)):
+            continue
+        if best is None or weight.sum() > best[0]:
+            best = (weight.sum(), pos, weight)
+    if best is None:
+        return None
+
+    _, pos, weight = best
+    # Weighted least squares of pos = first + k * pitch
+    k = np.arange(n, dtype=np.float64)
+    A = np.stack([np.ones(n), k], axis=1) * np.sqrt(weight)[:, None]
+    first, pitch = np.linalg.lstsq(A, pos * np.sqrt(weight), rcond=None)[0]
+    return float(first), float(pitch)
+
+def detect_grid(img, rows, cols):
+    """
+    Locate the digit grid on a full-monitor capture (best with a full board at the start of a game)
+    return: (x0, y0, pitch_w, pitch_h), sub-pixel grid corner and cell size in image coordinates
+    """
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY) if img.ndim == 3 else img
+    boxes = _glyph_boxes(gray)
+    if len(boxes) < rows + cols:
+        raise ValueError(f"找不到足夠的數字 (只有 {len(boxes)} 個)")
+    cx = boxes[:, 0] + boxes[:, 2] / 2.0
+    cy = boxes[:, 1] + boxes[:, 3] / 2.0
+    tol = np.median(boxes[:, 3]) * 0.5
+
+    # Rows first, then columns among the blobs of those rows, then rows again among those columns
+    keep = np.ones(len(boxes), dtype=bool)
+    fit_y = fit_x = None
+    for _ in range(2):
+        fit_y = _fit_lattice(cy[keep], rows, tol)
+        if fit_y is None:
+            raise ValueError(f"找不到 {rows} 列等距的數字")
+        first_y, pitch_y = fit_y
+        keep &= (cy > first_y - pitch_y / 2) & (cy < first_y + (rows - 0.5) * pitch_y)
+        fit_x = _fit_lattice(cx[keep], cols, tol)
+        if fit_x is None:
+            raise ValueError(f"找不到 {cols} 行等距的數字")
+        first_x, pitch_x = fit_x
+        keep &= (cx > first_x - pitch_x / 2) & (cx < first_x + (cols - 0.5) * pitch_x)
+
+    # Digits are centered in their cells
+    return first_x - pitch_x / 2, first_y - pitch_y / 2, pitch_x, pitch_y
+
+def calibrate(img, monitor_id, rows, cols):
+    """
+    Build a CalibrationProfile from a full-monitor capture
+    Templates are scaled to the calibrated OCR crop (GridLayout.feature_size) when the engine loads them
+    """
+    x0, y0, pitch_w, pitch_h = detect_grid(img, rows, cols)
+    left, top = int(math.floor(x0)), int(math.floor(y0))
+    right = int(math.ceil(x0 + cols * pitch_w))
+    bottom = int(math.ceil(y0 + rows * pitch_h))
+    left, top = max(left, 0), max(top, 0)
+    right, bottom = min(right, img.shape[1]), min(bottom, img.shape[0])
+
+    profile = CalibrationProfile(monitor_id, (left, top, right - left, bottom - top), rows, cols,
+                                 origin=(x0 - left, y0 - top), pitch=(pitch_w, pitch_h))
+    return profile
+
+def main():
+    import argparse
+    from engine import MONITOR_ID
+    from layout import load_layouts, LAYOUT_FILE
+
+    parser = argparse.ArgumentParser(description="校正: 在整個螢幕截圖中找出盤面，並儲存格子位置")
+    parser.add_argument("--monitor", type=int, default=MONITOR_ID)
+    parser.add_argument("--image", help="使用整個螢幕的截圖檔，而不是現在擷取")
+    parser.add_argument("--layout", help="版面名稱 (layouts.yaml，預設為檔案中的 default)")
+    parser.add_argument("--layouts-file", default=LAYOUT_FILE)
+    parser.add_argument("--out", default=PROFILE_FILE, help="校正檔路徑")
+    parser.add_argument("--preview", help="把偵測到的格線畫在截圖上並存成此檔案")
+    args = parser.parse_args()
+
+    layouts, default = load_layouts(args.layouts_file)
+    name = args.layout or default
+    if name not in layouts:
+        parser.error(f"找不到版面 {name}，可用的版面: {', '.join(layouts)}")
+    rows, cols = layouts[name]["rows"], layouts[name]["cols"]
+    crop = layouts[name].get("crop", DEFAULT_CROP)
+
+    if args.image:
+        img = cv2.imread(args.image)
+        if img is None:
+            parser.error(f"無法讀取圖片: {args.image}")
+    else:
+        from screen_shot import ScreenCapture
+        with ScreenCapture(monitor_idx=args.monitor) as sc:
+            img = sc.capture()
+
+    try:
+        profile = calibrate(img, args.monitor, rows, cols)
+    except ValueError as e:
+        print(f"校正失敗: {e}")
+        return
+    profile.save(args.out)
+    layout = GridLayout(rows, cols, profile.region, crop=crop, origin=profile.origin, pitch=profile.pitch)
+    print(f"盤面區域: {profile.region}")
+    print(f"格子大小: {profile.pitch[0]:.3f} x {profile.pitch[1]:.3f}  起點偏移: "
+          f"({profile.origin[0]:.2f}, {profile.origin[1]:.2f})  辨識大小: "
+          f"{layout.feature_size[0]} x {layout.feature_size[1]}")
+    print(f"已儲存到 {args.out}")
+
+    if args.preview:
+        x, y, _, _ = profile.region
+        for r in range(rows):
+            for c in range(cols):
+                cx, cy, cw, ch = layout.rect(r, c, r, c, x, y)
+                cv2.rectangle(img, (cx, cy), (cx + cw - 1, cy + ch - 1), (0, 0, 255), 1)
+        cv2.imwrite(args.preview, img)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+# cell_tracker.py
+import numpy as np
+
+import kernels
+
+# Results of CellTracker.update
+STABLE = 0     # Same as the last recognized image, nothing to do
+SETTLED = 1    # Changed and has stopped animating, needs OCR
+UNSETTLED = 2  # Still changing, do not trust the old digit and do not OCR yet
+
+class CellTracker:
+    def __init__(self, layout, diff_threshold=5, settle_frames=3, settle_ms=120,
+                 high_confidence=0.95, vote_window=5, recheck_low_ms=100, recheck_high_ms=3000,
+                 return_frames=2, return_threshold=1.0):
+        """
+        layout: GridLayout, Cell positions and the diff window (gap) of every cell
+        diff_threshold: float, Mean absolute difference (0~255) above which a cell counts as changed
+        settle_frames: int, Consecutive identical frames before a changed cell is recognized again
+        settle_ms: float, Alternatively, how long a changed cell must stay identical (milliseconds)
+        high_confidence: float, Match score from which a single reading is trusted
+        vote_window: int, Number of recent readings kept per cell for the majority vote
+        recheck_low_ms: float, Re-check interval of an unchanged cell whose vote is not decided yet
+        recheck_high_ms: float, Re-check interval of an unchanged cell that is trusted (longer, so a
+                         misread is still corrected), None to only recognize it again when its image changes
+        return_frames: int, A changed cell that looks like its recognized image again within this many
+                       frames is stable again without a reading (a flicker); after that it is read once
+                       it settles, since a new digit can look close to the old one
+        return_threshold: float, Mean difference under which a changed cell counts as back to its
+                          recognized image at any time (much tighter than diff_threshold)
+        """
+        self.layout = layout
+        rows, cols = layout.rows, layout.cols
+        self.rows, self.cols = rows, cols
+        self.diff_threshold = diff_threshold
+        self.settle_frames = settle_frames
+        self.settle_ms = settle_ms
+        self.high_confidence = high_confidence
+        self.vote_window = vote_window
+        self.recheck_low_ms = recheck_low_ms
+        self.recheck_high_ms = recheck_high_ms
+        self.return_frames = return_frames
+
+        inner = (rows, cols) + layout.inner_size
+        # Sum of absolute differences above this value means "changed"
+        self._sad_limit = diff_threshold * inner[2] * inner[3]
+        self._return_limit = return_threshold * inner[2] * inner[3]
+
+        # Image buffers, all updated in place
+        self.reference = np.zeros(inner, dtype=np.uint8)  # Image used for the last recognition
+        self.last_seen = np.zeros(inner, dtype=np.uint8)  # Previous frame (valid for unsettled cells)
+        self._hi = np.empty(inner, dtype=np.uint8)
+        self._lo = np.empty(inner, dtype=np.uint8)
+
+        # Per-cell state
+        self.digit = np.zeros((rows, cols), dtype=np.int8)         # Digit decided by the vote
+        self.score = np.zeros((rows, cols), dtype=np.float32)      # Match score of the last reading
+        self.updated_at = np.zeros((rows, cols), dtype=np.float64) # Time of the last reading
+        self.recheck_at = np.zeros((rows, cols), dtype=np.float64) # Next re-check of an unchanged cell
+        self.votes = np.zeros((rows, cols, vote_window), dtype=np.int8)
+        self.vote_count = np.zeros((rows, cols), dtype=np.int8)
+        self.stable_count = np.zeros((rows, cols), dtype=np.int32) # Consecutive frames without change
+        self.stable_since = np.zeros((rows, cols), dtype=np.float64)
+        self.has_reference = np.zeros((rows, cols), dtype=bool)
+        self.unsettled = np.zeros((rows, cols), dtype=bool)
+        self.unsettled_frames = np.zeros((rows, cols), dtype=np.int32)  # Frames since the cell changed
+        self.states = np.zeros((rows, cols), dtype=np.int8)
+        self.next_recheck = 0.0
+
+        # Scratch arrays
+        self._sad = np.empty((rows, cols), dtype=np.uint64)
+        self._changed = np.empty((rows, cols), dtype=bool)
+        self._same = np.empty((rows, cols), dtype=bool)
+        self._settled = np.empty((rows, cols), dtype=bool)
+        self._tmp = np.empty((rows, cols), dtype=bool)
+        self._elapsed = np.empty((rows, cols), dtype=np.float64)
+        self._committed = np.zeros((rows, cols), dtype=bool)
+        self._read_this_frame = False
+        self._cells = None
+        self._gather = None if layout.uniform else np.empty(inner, dtype=np.uint8)
+
+    def cell_views(self, gray_full):
+        """
+        Inner area of every cell as one (rows, cols, h, w) view of the frame, nothing is copied
+        (unevenly spaced cells are gathered into a reused buffer instead)
+        """
+        return self.layout.cell_views(gray_full, out=self._gather)
+
+    def _sum_absdiff(self, a, b, out):
+        # One fused loop with Numba, max(a, b) - min(a, b) on uint8 scratch buffers otherwise
+        return kernels.sum_absdiff(a, b, out, self._hi, self._lo)
+
+    def update(self, gray_full, now):
+        """
+        Classify every cell of the current frame
+        gray_full: Grayscale image of the whole board
+        now: float, Frame timestamp (seconds)
+        return: (rows, cols) array of STABLE / SETTLED / UNSETTLED
+        """
+        cells = self.cell_views(gray_full)
+        self._cells = cells
+        changed, same, settled, tmp = self._changed, self._same, self._settled, self._tmp
+
+        self._sum_absdiff(cells, self.reference, self._sad)
+        np.greater(self._sad, self._sad_limit, out=changed)
+        np.logical_not(self.has_reference, out=tmp)
+        np.logical_or(changed, tmp, out=changed)
+
+        # A cell unsettled for longer than a flicker stays changed until it is read again, unless it
+        # is practically identical to its recognized image (the reference is frozen during a fade, and
+        # some digit pairs differ from each other by less than diff_threshold)
+        np.greater(self._sad, self._return_limit, out=tmp)
+        np.logical_and(tmp, self.unsettled, out=tmp)
+        np.logical_and(tmp, self.unsettled_frames > self.return_frames, out=tmp)
+        np.logical_or(changed, tmp, out=changed)
+        np.add(self.unsettled_frames, 1, out=self.unsettled_frames, where=changed)
+        np.logical_not(changed, out=tmp)
+        np.copyto(self.unsettled_frames, 0, where=tmp)
+
+        # Identical to the previous frame? (last_seen is only meaningful for unsettled cells)
+        self._sum_absdiff(cells, self.last_seen, self._sad)
+        np.less_equal(self._sad, self._sad_limit, out=same)
+        np.logical_and(same, self.unsettled, out=same)
+        np.logical_and(same, changed, out=same)
+
+        np.add(self.stable_count, 1, out=self.stable_count, where=same)
+        np.logical_not(same, out=tmp)
+        np.copyto(self.stable_count, 0, where=tmp)
+        np.copyto(self.stable_since, now, where=tmp)
+        np.copyto(self.last_seen, cells, where=changed[:, :, None, None])
+
+        # Settled: stable for N frames, or stable for at least one frame and T milliseconds
+        np.greater_equal(self.stable_count, self.settle_frames, out=settled)
+        np.subtract(now, self.stable_since, out=self._elapsed)
+        np.greater_equal(self._elapsed, self.settle_ms / 1000, out=tmp)
+        np.logical_and(tmp, same, out=tmp)
+        np.logical_or(settled, tmp, out=settled)
+        np.logical_not(self.has_reference, out=tmp)
+        np.logical_or(settled, tmp, out=settled)
+        np.logical_and(settled, changed, out=settled)
+
+        # A cell that went back to its recognized image (see above) is simply stable again
+        np.copyto(self.unsettled, changed)
+        self.states.fill(STABLE)
+        np.copyto(self.states, UNSETTLED, where=changed)
+        np.copyto(self.states, SETTLED, where=settled)
+        return self.states
+
+    def is_due(self, r, c, now):
+        """Whether an unchanged cell should be recognized again to confirm its digit"""
+        return now >= self.recheck_at[r, c]
+
+    def commit(self, r, c, num, score, now, fresh=True):
+        """
+        Record a reading of a cell of the frame passed to the last update(), return the digit to use
+        fresh: bool, True if the image changed (SETTLED), False for a re-check of the same image
+        """
+        if fresh or self.vote_count[r, c] == 0:
+            # New image: old readings belong to another digit
+            self._committed[r, c] = True
+            self.unsettled[r, c] = False
+            self.unsettled_frames[r, c] = 0
+            self.stable_count[r, c] = 0
+            self.vote_count[r, c] = 0
+        self._read_this_frame = True
+
+        # Most recent readings, oldest first
+        n = int(self.vote_count[r, c])
+        votes = self.votes[r, c]
+        if n < self.vote_window:
+            votes[n] = num
+            n += 1
+            self.vote_count[r, c] = n
+        else:
+            votes[:-1] = votes[1:]
+            votes[-1] = num
+
+        counts = np.bincount(votes[:n])
+        best = int(counts.argmax())
+        best_count = int(counts[best])
+        if counts[num] == best_count:
+            # Tie: the latest reading wins
+            best = num
+        self.digit[r, c] = best
+        self.score[r, c] = score
+        self.updated_at[r, c] = now
+
+        # Trusted: a strong reading, or a clear majority of a full window
+        decided = (score >= self.high_confidence and best == num) or \
+                  (n == self.vote_window and best_count * 2 > n)
+        interval = self.recheck_high_ms if decided else self.recheck_low_ms
+        self.recheck_at[r, c] = np.inf if interval is None else now + interval / 1000
+        return best
+
+    def end_frame(self):
+        """Copy the images of all cells committed in this frame into the reference buffer"""
+        committed = self._committed
+        if committed.any():
+            np.copyto(self.reference, self._cells, where=committed[:, :, None, None])
+            np.logical_or(self.has_reference, committed, out=self.has_reference)
+            committed.fill(False)
+        if self._read_this_frame:
+            self.next_recheck = float(self.recheck_at.min())
+            self._read_this_frame = False
+        self._cells = None
+
+    def snapshot(self):
+        """Copy of the whole tracker state, e.g. for debugging or persistence"""
+        return {
+            "reference": self.reference.copy(),
+            "digit": self.digit.copy(),
+            "score": self.score.copy(),
+            "updated_at": self.updated_at.copy(),
+            "votes": self.votes.copy(),
+            "vote_count": self.vote_count.copy(),
+        }
@@ -0,0 +1,508 @@
+# engine.py
+import json
+import os
+import queue
+import sys
+import threading
+import time
+from collections import namedtuple
+import cv2
+
+START_TIME = time.perf_counter()  # Origin of the startup metrics when run from the command line
+
+from screen_shot import ScreenCapture, FrameRecorder, ReplaySource, RoiCapture
+from template_matcher import TemplateMatcher
+from solver import Solver
+import kernels
+from scheduler import FrameScheduler
+from metrics import Metrics
+from profiler import ProfileTrigger
+from pipeline import BoardPipeline
+from calibration import CalibrationProfile, PROFILE_FILE
+from layout import GridLayout, load_layout, LAYOUT_FILE
+
+# ==========================================
+# Configuration Area
+# ==========================================
+MONITOR_ID = 2
+LAYOUT = None                # Board layout name in layouts.yaml (grid size and region), None for its default
+MIN_CAPTURE_INTERVAL = 0.005 # Wait between captures while the board is changing (seconds)
+MAX_CAPTURE_INTERVAL = 0.2   # Wait between captures after a long idle period (seconds)
+IDLE_PROBE_INTERVAL = 0.04   # During idle waits, a raw grab compared on the row probe lines this often ends the wait
+FRAME_GATE_ENABLED = True    # Skip cell checks and solving when the whole frame is unchanged
+FRAME_GATE_TOLERANCE = 8     # Largest thumbnail pixel difference still treated as "unchanged"
+CELL_DIFF_THRESHOLD = 5      # Mean gray difference above which a cell counts as changed
+SETTLE_FRAMES = 3            # A changed cell is recognized after staying identical for this many frames
+SETTLE_MS = 120              # ... or for this many milliseconds
+HIGH_CONFIDENCE = 0.95       # Match score from which a single reading is trusted
+VOTE_WINDOW = 5              # Readings kept per cell, uncertain cells are decided by majority
+RECHECK_LOW_MS = 100         # Re-check interval of cells that are not trusted yet
+RECHECK_HIGH_MS = 3000       # Re-check interval of trusted cells, None to never re-read an unchanged cell
+REPLAY_FILE = None           # Recording name to play back instead of capturing the screen
+RECORD_FILE = None           # Recording name to save every captured frame to
+METRICS_ENABLED = True       # Per-stage latency histograms (see Engine.metrics)
+METRICS_LOG = None           # JSON-lines file the metrics snapshot is appended to
+METRICS_LOG_INTERVAL = 5.0   # Seconds between two metrics log lines
+CALIBRATION_FILE = PROFILE_FILE  # Profile written by calibration.py, overrides the layout's grid and region
+BOARDS_FILE = "boards.yaml"  # Several boards / monitors at once (see load_boards), used when the file exists
+TOP_K = 1                    # Ranked moves computed per board (EngineResult.moves / rects)
+PREDICT_NEXT = True          # Solve the board after the shown move ahead of time (see BoardPipeline)
+SOLVER_CACHE_SIZE = 4096     # Boards whose moves are remembered (idle frames, flicker, replays), 0 to disable
+SOLVER_CACHE_FILE = None     # File the solver cache is loaded from at start and saved to at exit
+PACKED_MATCHING = False      # Bit-packed templates scored with XOR + popcount (see TemplateMatcher packed)
+ROI_CAPTURE = False          # Between full grabs, only grab the shown moves' rectangles and the row probes (live only)
+FULL_CAPTURE_INTERVAL = 0.25 # Seconds between two full grabs in ROI capture
+ROI_HOLD = 0.5               # Seconds a move's rectangle is still grabbed after it stops being shown
+PROFILE_TRIGGER_FILE = "profile.trigger"  # Create it (or set NIKKE_PROFILE=seconds) to sample the worker, see profiler.py
+
+# index: frame number of the board, timestamp: perf_counter time of the frame
+# move: (r1, c1, r2, c2) or None, rect: global (x, y, w, h) of the move, (-1, -1, 0, 0) if none
+# board: index of the board in Engine.boards
+# moves, rects: the top_k ranked moves and their global rectangles, moves[0] is move
+EngineResult = namedtuple("EngineResult", ["index", "timestamp", "skipped", "changed", "move", "rect", "grid", "board",
+                                           "moves", "rects"],
+                          defaults=(0, (), ()))
+
+def load_boards(path=BOARDS_FILE):
+    """
+    Board list for several game clients, e.g. boards.yaml:
+        boards:
+          - {monitor: 2, layout: 14x8}
+          - {monitor: 3, layout: 14x8, region: [720, 220, 480, 830], calibration: calibration_3.json}
+    Keys per board: monitor, layout, region, calibration, replay, record (all optional)
+    return: list of dict, None if the file does not exist
+    """
+    if not path or not os.path.exists(path):
+        return None
+    try:
+        import yaml
+    except ImportError:
+        print(f"警告: 找不到 PyYAML，忽略 {path}")
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        data = yaml.safe_load(f) or {}
+    return data.get("boards") if isinstance(data, dict) else data
+
+class Board:
+    def __init__(self, index, monitor_id, layout, capture=None, profile=None, replay_file=None, record_file=None):
+        """
+        State of one captured board: its own source, pipeline (cell cache, votes) and offset
+        """
+        self.index = index
+        self.monitor_id = monitor_id
+        self.layout = layout
+        self.region = layout.region
+        self.capture = capture
+        self.profile = profile
+        self.replay_file = replay_file
+        self.record_file = record_file
+        self.pipeline = None
+        self.roi = None  # RoiCapture of a live board
+        self.frame_index = 0
+        self.base_x = self.base_y = 0
+        self._misses = 0
+        self.probe_source = None  # ScreenCapture of a live board, grabbed raw by probe_changed()
+        self.probe_rects = layout.probe_rects()
+
+    def open(self, matcher, solver, metrics, realtime=True, top_k=TOP_K):
+        if self.capture is None:
+            if self.replay_file:
+                self.capture = ReplaySource(self.replay_file, realtime=realtime)
+            else:
+                self.capture = ScreenCapture(monitor_idx=self.monitor_id, region=self.region)
+            if ROI_CAPTURE and not self.replay_file:
+                self.capture = RoiCapture(self.capture, full_interval=FULL_CAPTURE_INTERVAL, hold=ROI_HOLD,
+                                          probes=self.probe_rects, probe_tolerance=FRAME_GATE_TOLERANCE)
+            if self.record_file:
+                # Outside RoiCapture: one recorded frame per tick, as the pipeline sees it
+                self.capture = FrameRecorder(self.capture, self.record_file)
+        source = self.capture.source if isinstance(self.capture, FrameRecorder) else self.capture
+        if isinstance(source, RoiCapture):
+            self.roi = source
+            source = source.source
+        if isinstance(source, ScreenCapture):
+            self.probe_source = source
+
+        # Cache needed for differential updates lives in the pipeline
+        self.pipeline = BoardPipeline(
+            matcher, solver, layout=self.layout,
+            diff_threshold=CELL_DIFF_THRESHOLD, settle_frames=SETTLE_FRAMES, settle_ms=SETTLE_MS,
+            high_confidence=HIGH_CONFIDENCE, vote_window=VOTE_WINDOW, recheck_low_ms=RECHECK_LOW_MS,
+            recheck_high_ms=RECHECK_HIGH_MS,
+            gate_enabled=FRAME_GATE_ENABLED, gate_tolerance=FRAME_GATE_TOLERANCE,
+            metrics=metrics, top_k=top_k, predict=PREDICT_NEXT)
+
+        # Calculate absolute offset of the monitor
+        offset_left, offset_top = self.capture.monitor_offset()
+        self.base_x = offset_left + self.region[0]
+        self.base_y = offset_top + self.region[1]
+
+    def probe_changed(self, frame):
+        """
+        Cheap idle check: one raw grab compared with frame (the last processed one) on the row probe
+        lines only, without the gray conversion, frame gate and cell diff of a processed frame
+        """
+        raw = self.probe_source.capture_raw()
+        if raw.shape[:2] != frame.shape[:2]:
+            return True
+        for x, y, w, h in self.probe_rects:
+            if cv2.absdiff(raw[y:y + h, x:x + w, :3], frame[y:y + h, x:x + w]).max() > FRAME_GATE_TOLERANCE:
+                return True
+        return False
+
+    def update_rois(self, result):
+        """
+        Expected changes for the next ROI grabs: the ranked moves, plus the recent regions (kept
+        while the board is still changing); a prediction miss (change elsewhere) asks for a full grab
+        """
+        pipeline = self.pipeline
+        if pipeline.prediction_misses != self._misses:
+            self._misses = pipeline.prediction_misses
+            self.roi.request_full()
+        self.roi.set_rois(pipeline.move_rects(result.moves), renew=result.changed)
+
+    def close(self):
+        if self.capture is not None:
+            self.capture.close()
+
+class Engine:
+    def __init__(self, capture=None, monitor_id=MONITOR_ID, layout=LAYOUT,
+                 replay_file=REPLAY_FILE, record_file=RECORD_FILE, realtime=True,
+                 templates_file='digits.pkl', metrics=None, scheduler=None, calibration_file=CALIBRATION_FILE,
+                 boards=None, top_k=TOP_K, start_time=None):
+        """
+        Plain-Python board engine: capture -> pipeline -> results, usable without Qt
+        capture: CaptureSource, Frame source; default is ScreenCapture, or ReplaySource if replay_file is set
+        layout: GridLayout, or the name of a layout in layouts.yaml
+        realtime: bool, Replay at recorded speed (False: as fast as possible)
+        calibration_file: str, CalibrationProfile to load; its monitor, region and grid replace the layout's
+        boards: list of dict, Several boards sharing one template store and one matching pass per tick
+                (see load_boards), replaces the single-board arguments above
+        top_k: int, Number of ranked moves per result
+        start_time: float, perf_counter time the program started, origin of the startup metrics
+                    (default: now)
+        """
+        if boards:
+            self.boards = [self._make_board(i, spec) for i, spec in enumerate(boards)]
+        else:
+            spec = {"monitor": monitor_id, "layout": layout, "calibration": calibration_file,
+                    "replay": replay_file, "record": record_file}
+            self.boards = [self._make_board(0, spec, capture)]
+
+        # The first board, for callers that only use one
+        first = self.boards[0]
+        self.monitor_id = first.monitor_id
+        self.layout = first.layout
+        self.region = first.region
+        self.profile = first.profile
+        self.rows, self.cols = first.layout.rows, first.layout.cols
+
+        self.realtime = realtime
+        self.templates_file = templates_file
+        self.top_k = top_k
+        self.start_time = start_time if start_time is not None else time.perf_counter()
+        self.first_frame_time = None     # Seconds from start_time to the first processed frame
+        self.first_solution_time = None  # ... to the first frame with a move
+        self.scheduler = scheduler or FrameScheduler(min_interval=MIN_CAPTURE_INTERVAL,
+                                                     max_interval=MAX_CAPTURE_INTERVAL)
+        self.metrics = metrics or Metrics(enabled=METRICS_ENABLED, log_file=METRICS_LOG,
+                                          log_interval=METRICS_LOG_INTERVAL)
+        self.matcher = None
+        self.solver = None
+        self.running = False
+        # On-demand sampling of the capture loop; idle cost is one time check per frame
+        self.profile_trigger = ProfileTrigger(PROFILE_TRIGGER_FILE)
+
+        self._callbacks = []
+        self._queues = []
+        self._thread = None
+        self._stop = threading.Event()
+
+    @staticmethod
+    def _make_board(index, spec, capture=None):
+        profile = CalibrationProfile.load(spec.get("calibration"))
+        monitor_id = profile.monitor_id if profile is not None else spec.get("monitor", MONITOR_ID)
+        layout = spec.get("layout")
+        if not isinstance(layout, GridLayout):
+            region = spec.get("region")
+            layout = load_layout(layout, LAYOUT_FILE, profile=profile,
+                                 region=tuple(region) if region and profile is None else None)
+        return Board(index, monitor_id, layout, capture=capture, profile=profile,
+                     replay_file=spec.get("replay"), record_file=spec.get("record"))
+
+    # ---------- setup ----------
+    def open(self):
+        """Create the capture sources, the shared template store and the pipelines (heavy, done once)"""
+        if self.matcher is not None:
+            return
+        feature_size = None
+        sizes = {b.layout.feature_size for b in self.boards}
+        if all(b.profile is not None for b in self.boards) and len(sizes) == 1:
+            # Templates are scaled once at load time, cells are then compared at their captured size
+            feature_size = sizes.pop()
+            print(f"已載入校正檔: 盤面區域 {', '.join(str(b.region) for b in self.boards)}")
+
+        # Templates are unpickled and normalized, and the JIT kernels compiled, on background threads
+        # while the capture sources open and the first frames are diffed; only OCR waits for them
+        self.matcher = TemplateMatcher(templates_file=self.templates_file, feature_size=feature_size,
+                                       background=True, packed=PACKED_MATCHING)
+        self.solver = Solver(target_sum=10, warm_up=False, cache_size=SOLVER_CACHE_SIZE)
+        if self.solver.cache is not None and SOLVER_CACHE_FILE:
+            self.solver.cache.load(SOLVER_CACHE_FILE)
+        threading.Thread(target=kernels.warm_up, name="KernelWarmUp", daemon=True).start()
+        for board in self.boards:
+            board.open(self.matcher, self.solver, self.metrics, self.realtime, self.top_k)
+
+    def close(self):
+        for board in self.boards:
+            board.close()
+        if self.solver is not None and self.solver.cache is not None and SOLVER_CACHE_FILE:
+            self.solver.cache.save(SOLVER_CACHE_FILE)
+
+    @property
+    def pipeline(self):
+        """Pipeline of the first board"""
+        return self.boards[0].pipeline
+
+    @property
+    def capture(self):
+        """Capture source of the first board"""
+        return self.boards[0].capture
+
+    # ---------- results ----------
+    def add_callback(self, fn):
+        """fn(EngineResult) is called from the engine thread for every frame of every board"""
+        self._callbacks.append(fn)
+
+    def results(self, timeout=None):
+        """
+        Iterator over the results of a running engine, ends when the engine stops
+        timeout: float, Give up after waiting this long for one result
+        """
+        q = queue.Queue()
+        self._queues.append(q)
+        try:
+            while True:
+                item = q.get(timeout=timeout)
+                if item is None:
+                    return
+                yield item
+        finally:
+            self._queues.remove(q)
+
+    def _publish(self, result):
+        for fn in self._callbacks:
+            fn(result)
+        for q in self._queues:
+            q.put(result)
+
+    # ---------- frame processing ----------
+    def step(self, frame, now=None):
+        """Process one BGR frame of the (only) board region, return EngineResult"""
+        return self.step_all([frame], now)[0]
+
+    def step_all(self, frames, now=None):
+        """
+        Process one frame per board; the cells due on all boards are recognized in one matching pass
+        frames: list of BGR images, in the order of self.boards
+        return: list of EngineResult
+        """
+        self.open()
+        metrics = self.metrics
+        if now is None:
+            now = time.perf_counter()
+
+        pending = []
+        crops = []
+        for board, frame in zip(self.boards, frames):
+            board_crops = board.pipeline.begin(frame, now)
+            pending.append(board_crops)
+            if board_crops:
+                crops.extend(board_crops)
+
+        matches = []
+        if crops:
+            t = metrics.clock()
+            matches = self.matcher.recognize_crops_with_score(crops)
+            metrics.record("ocr", t)
+
+        results = []
+        i = 0
+        for board, board_crops in zip(self.boards, pending):
+            if board_crops is None:
+                r = board.pipeline.skipped_result()
+            else:
+                r = board.pipeline.finish(matches[i:i + len(board_crops)])
+                i += len(board_crops)
+            rects = board.pipeline.move_rects(r.moves, board.base_x, board.base_y)
+            rect = rects[0] if rects else (-1, -1, 0, 0)
+            results.append(EngineResult(board.frame_index, now, r.skipped, r.changed, r.move, rect, r.grid,
+                                        board.index, r.moves, rects))
+            board.frame_index += 1
+            if board.roi is not None:
+                board.update_rois(r)
+
+        t = metrics.clock()
+        for result in results:
+            self._publish(result)
+        metrics.record("emit", t)
+        if self.first_solution_time is None:
+            self._record_startup(results)
+        return results
+
+    def _record_startup(self, results):
+        """Startup gauges: time from start_time to the first processed frame and to the first move"""
+        now = time.perf_counter()
+        if self.first_frame_time is None and any(not r.skipped for r in results):
+            self.first_frame_time = now - self.start_time
+            self.metrics.gauge("startup_first_frame", self.first_frame_time)
+            if self.matcher.load_time is not None:
+                self.metrics.gauge("startup_templates", self.matcher.load_time)
+        if any(r.move for r in results):
+            self.first_solution_time = now - self.start_time
+            self.metrics.gauge("startup_first_solution", self.first_solution_time)
+            print(f"首次解答: 啟動後 {self.first_solution_time:.2f} 秒 "
+                  f"(模板載入 {self.matcher.load_time or 0:.2f} 秒，與擷取同時進行)")
+
+    def run(self):
+        """Blocking capture loop, returns when stop() is called or a replay ends"""
+        self.open()
+        self.running = True
+        metrics = self.metrics
+        clock = metrics.clock
+        scheduler = self.scheduler
+        profile_trigger = self.profile_trigger
+        probed = [b for b in self.boards if b.probe_source is not None]
+        frames = None
+
+        def idle_changed():
+            # Only live boards can be probed: a replay would lose the frame to the probe
+            return any(b.probe_changed(frames[b.index]) for b in probed)
+
+        print("差異更新模式啟動...")
+
+        while not self._stop.is_set():
+            profile_trigger.poll(time.perf_counter())
+            try:
+                # 1. Capture screen (every board)
+                t = clock()
+                try:
+                    frames = [board.capture.capture() for board in self.boards]
+                except EOFError:
+                    print("播放結束")
+                    break
+                metrics.record("capture", t)
+
+                # 2. Cell diff, OCR and solve
+                results = self.step_all(frames)
+
+                delay = scheduler.on_frame(any(r.changed for r in results))
+                if metrics.enabled:
+                    metrics.gauge("capture_rate", scheduler.rate)
+                    metrics.gauge("skip_rate", self.skip_rate)
+                    rois = [b.roi.time_ratio for b in self.boards if b.roi is not None]
+                    if rois:
+                        metrics.gauge("capture_time_ratio", sum(rois) / len(rois))
+                    if self.solver.cache is not None:
+                        metrics.gauge("solver_cache_hit_rate", self.solver.cache.hit_rate)
+                    metrics.maybe_log()
+                scheduler.wait(delay, lambda: not self._stop.is_set(), wake=idle_changed if probed else None,
+                               wake_interval=IDLE_PROBE_INTERVAL)
+
+            except Exception as e:
+                print(f"Worker Error: {e}")
+                scheduler.wait(scheduler.on_error(), lambda: not self._stop.is_set())
+
+        self.running = False
+        profile_trigger.stop()
+        self.close()
+        for q in self._queues:
+            q.put(None)
+
+    def start(self):
+        """Run the capture loop on a background thread"""
+        self._stop.clear()
+        self.running = True
+        self._thread = threading.Thread(target=self.run, name="Engine", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+            self._thread = None
+
+    # ---------- exposed metrics ----------
+    @property
+    def capture_rate(self):
+        """Current capture rate (frames per second)"""
+        return self.scheduler.rate
+
+    @property
+    def skip_rate(self):
+        """Fraction of frames skipped by the whole-frame gate, averaged over the boards"""
+        rates = [b.pipeline.frame_gate.skip_rate for b in self.boards if b.pipeline is not None]
+        return sum(rates) / len(rates) if rates else 0.0
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="無介面模式: 辨識盤面並以 JSON lines 輸出盤面與解")
+    parser.add_argument("--replay", help="播放 FrameRecorder 錄影檔，而不是擷取螢幕")
+    parser.add_argument("--fast", action="store_true", help="播放錄影時不等待，盡快處理")
+    parser.add_argument("--record", help="同時把擷取到的畫面錄影到此名稱")
+    parser.add_argument("--monitor", type=int, default=MONITOR_ID)
+    parser.add_argument("--layout", default=LAYOUT, help="版面名稱 (layouts.yaml)")
+    parser.add_argument("--region", help="盤面區域 x,y,w,h (指定時不使用校正檔)")
+    parser.add_argument("--calibration", default=CALIBRATION_FILE, help="校正檔路徑")
+    parser.add_argument("--boards", default=BOARDS_FILE, help="多盤面設定檔 (存在時取代上面的單一盤面設定)")
+    parser.add_argument("--templates", default="digits.pkl")
+    parser.add_argument("--top-k", type=int, default=TOP_K, help="每個盤面輸出前幾名的解")
+    parser.add_argument("--out", help="輸出檔案 (預設為標準輸出)")
+    parser.add_argument("--all", action="store_true",
+                        help="輸出每一格影格，畫面未變而略過的影格帶有 \"skipped\": true (預設只輸出有變化的影格)")
+    args = parser.parse_args()
+
+    layout = args.layout
+    try:
+        if args.region:
+            layout = load_layout(args.layout, LAYOUT_FILE, region=tuple(int(v) for v in args.region.split(",")))
+        engine = Engine(monitor_id=args.monitor, layout=layout, replay_file=args.replay,
+                        record_file=args.record, realtime=not args.fast, templates_file=args.templates,
+                        calibration_file=None if args.region else args.calibration,
+                        boards=load_boards(args.boards), top_k=args.top_k, start_time=START_TIME)
+    except ValueError as e:
+        parser.error(str(e))
+    # Status messages go to stderr so stdout only carries JSON lines
+    out = open(args.out, "w", encoding="utf-8") if args.out else sys.stdout
+    sys.stdout = sys.stderr
+
+    def write(result):
+        if not args.all and (result.skipped or (not result.changed and result.index > 0)):
+            return
+        line = {
+            "board": result.board,
+            "frame": result.index,
+            "time": result.timestamp,
+            "grid": result.grid,
+            "move": list(result.move) if result.move else None,
+            "rect": list(result.rect),
+        }
+        if result.skipped:
+            line["skipped"] = True  # Unchanged frame passed over by the frame gate, same board as before
+        if engine.top_k > 1:
+            line["moves"] = [list(m) for m in result.moves]
+        out.write(json.dumps(line) + "\n")
+        out.flush()
+
+    engine.add_callback(write)
+    try:
+        engine.run()
+    except KeyboardInterrupt:
+        engine.close()
+    finally:
+        if args.out:
+            out.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+# frame_gate.py
+import cv2
+
+class FrameGate:
+    def __init__(self, thumb_size=(32, 56), tolerance=8, enabled=True):
+        """
+        thumb_size: tuple (w, h), Size of the downsampled thumbnail used as the frame signature
+        tolerance: int, Largest per-pixel difference (0~255) at which two thumbnails still count as identical
+        enabled: bool, When False every frame is reported as changed
+        """
+        self.thumb_size = thumb_size
+        self.tolerance = tolerance
+        self.enabled = enabled
+
+        self.last_thumb = None
+        self.checked = 0
+        self.skipped = 0
+
+    def is_changed(self, gray_frame):
+        """
+        Compare the frame with the last accepted frame
+        gray_frame: Grayscale image of the whole board
+        return: False if the frame is identical to the previous one within tolerance
+        """
+        if not self.enabled:
+            return True
+
+        self.checked += 1
+        # INTER_AREA averages whole blocks, so sensor noise cancels out while a changed digit does not
+        thumb = cv2.resize(gray_frame, self.thumb_size, interpolation=cv2.INTER_AREA)
+
+        if self.last_thumb is not None and self.last_thumb.shape == thumb.shape:
+            # Max instead of mean: a single changed cell only covers a few thumbnail pixels
+            diff = cv2.absdiff(thumb, self.last_thumb)
+            if diff.max() <= self.tolerance:
+                self.skipped += 1
+                return False
+
+        self.last_thumb = thumb
+        return True
+
+    def reset(self):
+        """Forget the stored signature so the next frame is always processed"""
+        self.last_thumb = None
+
+    @property
+    def skip_rate(self):
+        """Fraction of checked frames that were skipped"""
+        if self.checked == 0:
+            return 0.0
+        return self.skipped / self.checked
@@ -0,0 +1,150 @@
+# kernels.py
+import importlib.util
+import threading
+import numpy as np
+
+# Numba is optional: when installed, the loops of kernels_numba.py are JIT compiled (and cached on disk),
+# otherwise the NumPy versions are used. Both give the same results as the Python code in solver.py.
+# Only its presence is checked here, the import itself waits until a kernel is first needed.
+HAVE_NUMBA = importlib.util.find_spec("numba") is not None
+
+# ---------- NumPy versions ----------
+def prefix_sum_numpy(grid):
+    """
+    grid: (rows, cols) int array
+    return: (rows + 1, cols + 1) int32 summed-area table, p[r + 1][c + 1] = sum of grid[:r + 1, :c + 1]
+    """
+    p = np.zeros((grid.shape[0] + 1, grid.shape[1] + 1), dtype=np.int32)
+    np.cumsum(np.cumsum(grid, axis=0, dtype=np.int32), axis=1, out=p[1:, 1:])
+    return p
+
+def pair_scan_numpy(grid, blocked, target):
+    """
+    Rectangles spanned by two non-zero, unblocked cells whose digits sum to target
+    grid: (rows, cols) int32, blocked: (rows, cols) bool or None
+    return: (n, 5) int32 array of (area, r1, c1, r2, c2), in itertools.combinations order of the cells
+    """
+    mask = grid > 0
+    if blocked is not None:
+        mask &= ~blocked
+    rs, cs = np.nonzero(mask)
+    i, j = np.triu_indices(len(rs), 1)
+    r1, c1, r2, c2 = rs[i], cs[i], rs[j], cs[j]
+    min_r, max_r = np.minimum(r1, r2), np.maximum(r1, r2) + 1
+    min_c, max_c = np.minimum(c1, c2), np.maximum(c1, c2) + 1
+
+    p = prefix_sum_numpy(grid)
+    hit = (p[max_r, max_c] - p[min_r, max_c] - p[max_r, min_c] + p[min_r, min_c]) == target
+    if blocked is not None:
+        b = prefix_sum_numpy(blocked)
+        hit &= (b[max_r, max_c] - b[min_r, max_c] - b[max_r, min_c] + b[min_r, min_c]) == 0
+    area = (max_r - min_r) * (max_c - min_c)
+    return np.stack([area, r1, c1, r2, c2], axis=1)[hit].astype(np.int32)
+
+def sum_absdiff_numpy(a, b, out, hi=None, lo=None):
+    """
+    Per-cell sum of |a - b|
+    a, b: (rows, cols, h, w) uint8, out: (rows, cols) uint64
+    hi, lo: optional uint8 scratch buffers of a's shape
+    """
+    if hi is None:
+        hi, lo = np.empty(a.shape, dtype=np.uint8), np.empty(a.shape, dtype=np.uint8)
+    # |a - b| on uint8 without a signed temporary: max(a, b) - min(a, b)
+    np.maximum(a, b, out=hi)
+    np.minimum(a, b, out=lo)
+    np.subtract(hi, lo, out=hi)
+    return np.sum(hi, axis=(2, 3), dtype=np.uint64, out=out)
+
+_bitwise_count = getattr(np, "bitwise_count", None)  # NumPy >= 2.0
+_POPCOUNT8 = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+def popcount(x):
+    """Number of set bits of every element of an unsigned integer array"""
+    if _bitwise_count is not None:
+        return _bitwise_count(x)
+    x = np.ascontiguousarray(x)
+    return _POPCOUNT8[x.view(np.uint8)].reshape(x.shape + (x.itemsize,)).sum(axis=-1, dtype=np.uint8)
+
+def hamming_numpy(a, b_words):
+    """
+    Hamming distances between bit-packed rows (XOR + popcount)
+    a: (n, words) uint64
+    b_words: (words, m) uint64, the other rows word-major so every word is one contiguous row
+    return: (n, m) uint16, number of differing bits of every pair (rows of up to 65535 bits)
+    """
+    a_words = np.ascontiguousarray(a.T)
+    d = np.zeros((a.shape[0], b_words.shape[1]), dtype=np.uint16)
+    # One word at a time keeps the temporaries at (n, m)
+    xor = np.empty(d.shape, dtype=np.uint64)
+    for w in range(b_words.shape[0]):
+        np.bitwise_xor(a_words[w][:, None], b_words[w][None, :], out=xor)
+        d += popcount(xor)
+    return d
+
+# ---------- Numba versions ----------
+_jit = None
+
+def _numba():
+    """kernels_numba, imported (and its cached machine code loaded) on first use"""
+    global _jit
+    if _jit is None:
+        import kernels_numba
+        _jit = kernels_numba
+    return _jit
+
+def prefix_sum_numba(grid):
+    return _numba().prefix_sum(grid)
+
+def pair_scan_numba(grid, blocked, target):
+    if blocked is None:
+        blocked = np.zeros(grid.shape, dtype=np.bool_)
+    return _numba().pair_scan(grid, blocked, target)
+
+def sum_absdiff_numba(a, b, out, hi=None, lo=None):
+    return _numba().sum_absdiff(a, b, out)
+
+_warmed_up = False
+_warm_up_lock = threading.Lock()
+
+# Versions used by the rest of the program: Numba once warm_up() has finished, NumPy before that
+# (and without Numba), so the first frames never wait for the JIT
+def prefix_sum(grid):
+    if _warmed_up:
+        return prefix_sum_numba(grid)
+    return prefix_sum_numpy(grid)
+
+def pair_scan(grid, blocked, target):
+    if _warmed_up:
+        return pair_scan_numba(grid, blocked, target)
+    return pair_scan_numpy(grid, blocked, target)
+
+def sum_absdiff(a, b, out, hi=None, lo=None):
+    if _warmed_up:
+        return _jit.sum_absdiff(a, b, out)
+    return sum_absdiff_numpy(a, b, out, hi, lo)
+
+def warm_up():
+    """
+    Compile (or load from the disk cache) every JIT kernel with the argument types used at run time,
+    so the first frame does not pay for it. Does nothing without Numba or when already done.
+    Safe to call from a background thread while other threads wait for it.
+    """
+    global _warmed_up
+    if not HAVE_NUMBA or _warmed_up:
+        return
+    with _warm_up_lock:
+        if not _warmed_up:
+            _warm_up()
+
+def _warm_up():
+    global _warmed_up
+    grid = np.ones((2, 2), dtype=np.int32)
+    pair_scan_numba(grid, None, 2)
+    prefix_sum_numba(grid)
+    # Cell views are strided (evenly spaced grids) or contiguous (gathered cells)
+    frame = np.zeros((4, 4), dtype=np.uint8)
+    view = frame.reshape(2, 2, 2, 2).transpose(0, 2, 1, 3)
+    out = np.empty((2, 2), dtype=np.uint64)
+    sum_absdiff_numba(view, np.ascontiguousarray(view), out)
+    sum_absdiff_numba(np.ascontiguousarray(view), np.ascontiguousarray(view), out)
+    _warmed_up = True
@@ -0,0 +1,61 @@
+# kernels_numba.py
+# JIT versions of the kernels in kernels.py, imported by it on first use (importing Numba is slow)
+import numba
+import numpy as np
+
+@numba.njit(cache=True)
+def prefix_sum(grid):
+    rows, cols = grid.shape
+    p = np.zeros((rows + 1, cols + 1), dtype=np.int32)
+    for r in range(rows):
+        for c in range(cols):
+            p[r + 1, c + 1] = p[r, c + 1] + p[r + 1, c] - p[r, c] + grid[r, c]
+    return p
+
+@numba.njit(cache=True)
+def pair_scan(grid, blocked, target):
+    rows, cols = grid.shape
+    p = prefix_sum(grid)
+    b = prefix_sum(blocked.astype(np.int32))
+
+    nodes = np.empty((rows * cols, 2), dtype=np.int32)
+    n = 0
+    for r in range(rows):
+        for c in range(cols):
+            if grid[r, c] > 0 and not blocked[r, c]:
+                nodes[n, 0] = r
+                nodes[n, 1] = c
+                n += 1
+
+    out = np.empty((n * (n - 1) // 2, 5), dtype=np.int32)
+    k = 0
+    for i in range(n):
+        r1, c1 = nodes[i, 0], nodes[i, 1]
+        for j in range(i + 1, n):
+            r2, c2 = nodes[j, 0], nodes[j, 1]
+            min_r, max_r = min(r1, r2), max(r1, r2) + 1
+            min_c, max_c = min(c1, c2), max(c1, c2) + 1
+            if p[max_r, max_c] - p[min_r, max_c] - p[max_r, min_c] + p[min_r, min_c] != target:
+                continue
+            if b[max_r, max_c] - b[min_r, max_c] - b[max_r, min_c] + b[min_r, min_c] != 0:
+                continue
+            out[k, 0] = (max_r - min_r) * (max_c - min_c)
+            out[k, 1] = r1
+            out[k, 2] = c1
+            out[k, 3] = r2
+            out[k, 4] = c2
+            k += 1
+    return out[:k]
+
+@numba.njit(cache=True)
+def sum_absdiff(a, b, out):
+    rows, cols, h, w = a.shape
+    for r in range(rows):
+        for c in range(cols):
+            s = 0
+            for y in range(h):
+                for x in range(w):
+                    d = np.int32(a[r, c, y, x]) - np.int32(b[r, c, y, x])
+                    s += d if d >= 0 else -d
+            out[r, c] = s
+    return out
@@ -0,0 +1,167 @@
+# layout.py
+import os
+import numpy as np
+
+LAYOUT_FILE = "layouts.yaml"
+
+# Used when layouts.yaml (or PyYAML) is not available
+BUILTIN_LAYOUTS = {
+    "14x8": {"rows": 14, "cols": 8, "region": [720, 220, 480, 830]},
+}
+DEFAULT_LAYOUT = "14x8"
+
+DEFAULT_GAP = 0.1                     # Margin removed on each side of a cell before diffing (fraction of the cell)
+DEFAULT_CROP = (0.2, 0.8, 0.25, 0.75) # OCR window inside a cell (y1, y2, x1, x2 as fractions of the cell)
+
+class GridLayout:
+    def __init__(self, rows, cols, region, name=None, gap=DEFAULT_GAP, crop=DEFAULT_CROP,
+                 origin=(0.0, 0.0), pitch=None):
+        """
+        Cell geometry of one board, every table is computed here once and shared by all modules
+        region: tuple (x, y, w, h), Capture box relative to the monitor
+        gap: float, Margin of the diff window, as a fraction of the cell size
+        crop: tuple (y1, y2, x1, x2), OCR window inside a cell, as fractions of the cell size
+        origin: tuple (x, y), Sub-pixel top-left corner of the grid inside region (calibration)
+        pitch: tuple (w, h), Sub-pixel cell size, default is region w // cols, h // rows
+        """
+        self.name = name or f"{rows}x{cols}"
+        self.rows, self.cols = rows, cols
+        self.region = tuple(int(v) for v in region)
+        self.width, self.height = self.region[2], self.region[3]
+        self.gap = gap
+        self.crop = tuple(crop)
+
+        if pitch is None:
+            pitch = (self.width // cols, self.height // rows)
+        self.pitch = (float(pitch[0]), float(pitch[1]))
+        self.origin = (float(origin[0]), float(origin[1]))
+
+        # Every cell is cut with the same whole-pixel size
+        cw, ch = int(round(self.pitch[0])), int(round(self.pitch[1]))
+        self.cell_w, self.cell_h = cw, ch
+        self.gap_y, self.gap_x = int(ch * gap), int(cw * gap)
+
+        # Cell corners, rounded from the sub-pixel grid so the error never adds up along a row
+        ys = np.rint(self.origin[1] + np.arange(rows) * self.pitch[1]).astype(np.intp)
+        xs = np.rint(self.origin[0] + np.arange(cols) * self.pitch[0]).astype(np.intp)
+        self.y_starts = np.clip(ys, 0, self.height - ch)
+        self.x_starts = np.clip(xs, 0, self.width - cw)
+        self.uniform = (np.array_equal(self.y_starts, np.arange(rows) * ch)
+                        and np.array_equal(self.x_starts, np.arange(cols) * cw))
+
+        # Per-cell windows relative to the board image, indexed [r][c]
+        cy1, cy2, cx1, cx2 = int(ch * crop[0]), int(ch * crop[1]), int(cw * crop[2]), int(cw * crop[3])
+        self.feature_size = (cy2 - cy1, cx2 - cx1)
+        self.crop_box = (cy1, cy2, cx1, cx2)
+        self.cell_slices = [[(slice(y, y + ch), slice(x, x + cw)) for x in self.x_starts] for y in self.y_starts]
+        self.crop_slices = [[(slice(y + cy1, y + cy2), slice(x + cx1, x + cx2)) for x in self.x_starts]
+                            for y in self.y_starts]
+        self.inner_size = (ch - 2 * self.gap_y, cw - 2 * self.gap_x)
+
+        # Diff windows of all cells as gather indices into a flattened frame (used when not uniform)
+        iy = (self.y_starts[:, None] + np.arange(self.gap_y, ch - self.gap_y))[:, None, :, None]
+        ix = (self.x_starts[:, None] + np.arange(self.gap_x, cw - self.gap_x))[None, :, None, :]
+        self._inner_y, self._inner_x = iy, ix
+        self._gather_index = None
+        self._gather_width = None
+
+    # ---------- construction ----------
+    @classmethod
+    def from_dict(cls, name, data):
+        region = data.get("region")
+        if region is None:
+            raise ValueError(f"版面 {name} 沒有設定 region，請先執行 calibration.py")
+        if (not isinstance(region, (list, tuple)) or len(region) != 4
+                or not all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in region)):
+            raise ValueError(f"版面 {name} 的 region 必須是 [x, y, w, h]: {region!r}")
+        return cls(data["rows"], data["cols"], data["region"], name=name,
+                   gap=data.get("gap", DEFAULT_GAP), crop=data.get("crop", DEFAULT_CROP),
+                   origin=data.get("origin", (0.0, 0.0)), pitch=data.get("pitch"))
+
+    def with_region(self, region):
+        """Same grid, gap and crop, evenly spread over another capture box"""
+        return GridLayout(self.rows, self.cols, region, name=self.name, gap=self.gap, crop=self.crop)
+
+    def resized(self, width, height):
+        """Same grid on a board image of another size"""
+        return self.with_region((0, 0, width, height))
+
+    # ---------- per-frame access (table lookups only) ----------
+    def cell(self, img, r, c):
+        return img[self.cell_slices[r][c]]
+
+    def ocr_crop(self, img, r, c):
+        return img[self.crop_slices[r][c]]
+
+    def cell_views(self, gray, out=None):
+        """
+        Diff window of every cell as one (rows, cols, h, w) array.
+        Evenly spaced grids return a view of gray; otherwise the windows are gathered into out.
+        """
+        rows, cols, ch, cw = self.rows, self.cols, self.cell_h, self.cell_w
+        if self.uniform:
+            grid = gray[:rows * ch, :cols * cw].reshape(rows, ch, cols, cw).transpose(0, 2, 1, 3)
+            return grid[:, :, self.gap_y:ch - self.gap_y, self.gap_x:cw - self.gap_x]
+
+        gray = np.ascontiguousarray(gray)
+        # Flat indices depend on the frame width, so they are rebuilt only if it changes
+        width = gray.shape[1]
+        if width != self._gather_width:
+            self._gather_index = self._inner_y * width + self._inner_x
+            self._gather_width = width
+        return np.take(gray.reshape(-1), self._gather_index, out=out)
+
+    def rect(self, r1, c1, r2, c2, base_x=0, base_y=0):
+        """Pixel rectangle (x, y, w, h) covering the cells between two corners"""
+        min_r, max_r = min(r1, r2), max(r1, r2)
+        min_c, max_c = min(c1, c2), max(c1, c2)
+        x = int(self.x_starts[min_c])
+        y = int(self.y_starts[min_r])
+        return (base_x + x, base_y + y,
+                int(self.x_starts[max_c]) + self.cell_w - x, int(self.y_starts[max_r]) + self.cell_h - y)
+
+    def probe_rects(self):
+        """One-pixel lines (x, y, w, 1) across the grid through the middle of every row's OCR window"""
+        cy = (self.crop_box[0] + self.crop_box[1]) // 2
+        x = int(self.x_starts[0])
+        w = int(self.x_starts[-1]) + self.cell_w - x
+        return [(x, int(y) + cy, w, 1) for y in self.y_starts]
+
+def load_layouts(path=LAYOUT_FILE):
+    """
+    Read the layout definitions
+    return: (dict name -> raw dict, default name)
+    """
+    if path and os.path.exists(path):
+        try:
+            import yaml
+        except ImportError:
+            print("警告: 找不到 PyYAML，使用內建版面")
+        else:
+            with open(path, "r", encoding="utf-8") as f:
+                data = yaml.safe_load(f) or {}
+            layouts = data.get("layouts") or {}
+            return layouts, data.get("default", next(iter(layouts), DEFAULT_LAYOUT))
+    return dict(BUILTIN_LAYOUTS), DEFAULT_LAYOUT
+
+def load_layout(name=None, path=LAYOUT_FILE, profile=None, region=None):
+    """
+    name: str, Layout name in the file, None for the file's default
+    profile: CalibrationProfile, Measured geometry that replaces the layout's grid and region
+    region: tuple (x, y, w, h), Replaces the layout's region
+    return: GridLayout
+    """
+    layouts, default = load_layouts(path)
+    name = name or default
+    if name not in layouts:
+        raise ValueError(f"找不到版面 {name}，可用的版面: {', '.join(layouts)}")
+    data = layouts[name]
+    if not isinstance(data, dict) or "rows" not in data or "cols" not in data:
+        raise ValueError(f"版面 {name} 需要設定 rows 與 cols")
+    if profile is not None:
+        return GridLayout(profile.rows, profile.cols, profile.region, name=name,
+                          gap=data.get("gap", DEFAULT_GAP), crop=data.get("crop", DEFAULT_CROP),
+                          origin=profile.origin, pitch=profile.pitch)
+    if region is not None:
+        data = dict(data, region=region)
+    return GridLayout.from_dict(name, data)
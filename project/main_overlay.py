@@ -15,181 +15,200 @@
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
 import sys
+import threading
 import time
-import mss
-import cv2
-import numpy as np
-from PyQt5.QtCore import Qt, QThread, pyqtSignal, QRect
-from PyQt5.QtGui import QPainter, QPen, QColor, QFont
-from PyQt5.QtWidgets import QApplication, QWidget
 
-from screen_shot import ScreenCapture
-from template_matcher import TemplateMatcher
-from solver import Solver
+START_TIME = time.perf_counter()  # Origin of the startup metrics (time to first solution)
+
+from PyQt5.QtCore import Qt, QThread, QTimer, pyqtSignal, QRect
+from PyQt5.QtGui import QPainter, QPen, QBrush, QColor, QFont
+from PyQt5.QtWidgets import QApplication, QWidget
 
 # ==========================================
 # Configuration Area
 # ==========================================
-GAME_REGION = (720, 220, 480, 830) 
-MONITOR_ID = 2
-ROWS = 14
-COLS = 8
+SHOW_HUD = False             # Draw the metrics summary on the overlay
+TOP_K = 3                    # Number of ranked moves shown per board
+PEN_WIDTH = 5                # Width of the move rectangles
+# Rectangle colour per rank (best move first), later ranks reuse the last colour
+RANK_COLORS = [(255, 0, 0), (255, 160, 0), (255, 255, 0, 200), (0, 200, 255, 160)]
+HUD_RECT = (10, 10, 600, 400)
 
 class GameWorker(QThread):
-    # Emit global coordinates (Global X, Global Y, W, H)
-    solution_found = pyqtSignal(int, int, int, int)
+    # Emitted with the board index when its move rectangles change, read them with latest_rects()
+    solution_changed = pyqtSignal(int)
+    # Emitted once the engine exists: list of (board index, monitor id)
+    engine_ready = pyqtSignal(list)
+    # Emitted with the message when the engine cannot be built or opened, the thread then ends
+    engine_failed = pyqtSignal(str)
 
     def __init__(self):
         super().__init__()
-        self.running = True
-        
-        # Cache needed for differential updates
-        self.cell_cache_img = {} 
-        self.current_grid = [[0]*COLS for _ in range(ROWS)]
-        self.first_run = True
+        # All the logic lives in the engine, this thread only forwards its results to Qt.
+        # One engine serves every board, so the template store is loaded once.
+        # The engine (OpenCV, NumPy, templates) is imported and built in run(), after the windows show.
+        self.engine = None
+        self.metrics = None
+        self._stopping = False
+
+        # Latest ranked global (x, y, w, h) list of every board, written by the engine thread
+        self._rects = {}
+        self._lock = threading.Lock()
+
+    @property
+    def capture_rate(self):
+        """Current capture rate (frames per second)"""
+        return self.engine.capture_rate if self.engine is not None else 0.0
+
+    @property
+    def skip_rate(self):
+        """Fraction of frames skipped by the whole-frame gate"""
+        return self.engine.skip_rate if self.engine is not None else 0.0
+
+    def _on_result(self, result):
+        # Most frames repeat the previous answer, only a different rectangle wakes the GUI thread
+        with self._lock:
+            if self._rects.get(result.board) == result.rects:
+                return
+            self._rects[result.board] = result.rects
+        self.solution_changed.emit(result.board)
+
+    def latest_rects(self):
+        """Copy of {board: ranked list of (x, y, w, h)}, empty when a board has no move"""
+        with self._lock:
+            return dict(self._rects)
 
     def run(self):
-        cap = ScreenCapture(monitor_idx=MONITOR_ID, region=GAME_REGION)
-        matcher = TemplateMatcher(templates_file='digits.pkl')
-        solver = Solver(target_sum=10)
-        
-        cell_w = GAME_REGION[2] // COLS
-        cell_h = GAME_REGION[3] // ROWS
-
-        # Calculate absolute offset for Monitor 2
-        offset_left = 0
-        offset_top = 0
-        with mss.mss() as sct:
-            if MONITOR_ID < len(sct.monitors):
-                monitor = sct.monitors[MONITOR_ID]
-                offset_left = monitor["left"]
-                offset_top = monitor["top"]
-        base_x = offset_left + GAME_REGION[0]
-        base_y = offset_top + GAME_REGION[1]
-
-        print("差異更新模式啟動...")
-        
-        while self.running:
-            try:
-                # 1. Capture screen
-                img = cap.capture()
-                gray_full = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-                
-                updated_count = 0
-
-                # 2. Iterate to check cell changes
-                for r in range(ROWS):
-                    for c in range(COLS):
-                        y1, y2 = r * cell_h, (r + 1) * cell_h
-                        x1, x2 = c * cell_w, (c + 1) * cell_w
-                        
-                        # Extract grayscale cell (for difference comparison)
-                        gap_x = int(cell_w * 0.1)
-                        gap_y = int(cell_h * 0.1)
-                        gray_cell = gray_full[y1+gap_y:y2-gap_y, x1+gap_x:x2-gap_x]
-
-                        need_ocr = False
-                        
-                        if self.first_run:
-                            need_ocr = True
-                        else:
-                            last_img = self.cell_cache_img.get((r, c))
-                            if last_img is not None:
-                                diff = cv2.absdiff(gray_cell, last_img)
-                                if np.mean(diff) > 5: # Change threshold
-                                    need_ocr = True
-                            else:
-                                need_ocr = True
-
-                        if need_ocr:
-                            # === Simplified here! Directly call the new function ===
-                            # Extract color cell image
-                            color_cell = img[y1:y2, x1:x2]
-                            
-                            # Let TemplateMatcher recognize this cell
-                            num = matcher.recognize_cell(color_cell)
-                            
-                            self.current_grid[r][c] = num
-                            
-                            # Update Cache
-                            self.cell_cache_img[(r, c)] = gray_cell
-                            updated_count += 1
-
-                self.first_run = False
-                
-                # 3. Solve
-                solution = solver.solve(self.current_grid)
-
-                if solution:
-                    r1, c1, r2, c2 = solution
-                    
-                    # Double check if the solution is valid
-                    if self.current_grid[r1][c1] != 0 and self.current_grid[r2][c2] != 0:
-                        min_r, max_r = min(r1, r2), max(r1, r2)
-                        min_c, max_c = min(c1, c2), max(c1, c2)
-                        
-                        global_x = base_x + (min_c * cell_w)
-                        global_y = base_y + (min_r * cell_h)
-                        draw_w = (max_c - min_c + 1) * cell_w
-                        draw_h = (max_r - min_r + 1) * cell_h
-                        
-                        self.solution_found.emit(global_x, global_y, draw_w, draw_h)
-                    else:
-                        self.solution_found.emit(-1, -1, 0, 0)
-                else:
-                    self.solution_found.emit(-1, -1, 0, 0)
-                
-                time.sleep(0.01)
-
-            except Exception as e:
-                print(f"Worker Error: {e}")
-                time.sleep(1)
+        engine = None
+        try:
+            from engine import Engine, load_boards
+
+            # Layouts, calibration, templates and capture sources are all resolved here
+            engine = Engine(boards=load_boards(), top_k=TOP_K, start_time=START_TIME)
+            engine.open()
+        except Exception as e:
+            print(f"啟動失敗: {e}")
+            if engine is not None:
+                try:
+                    engine.close()
+                except Exception:
+                    pass
+            self.engine_failed.emit(str(e))
+            return
+        engine.add_callback(self._on_result)
+        self.metrics = engine.metrics
+        self.engine = engine
+        self.engine_ready.emit([(board.index, board.monitor_id) for board in engine.boards])
+        if not self._stopping:
+            engine.run()
 
     def stop(self):
-        self.running = False
+        self._stopping = True
+        if self.engine is not None:
+            self.engine.stop()
         self.wait()
 
 class GameOverlay(QWidget):
-    def __init__(self):
+    def __init__(self, worker, screen, boards, show_hud=SHOW_HUD):
+        """
+        One transparent window per screen
+        worker: GameWorker, Shared by all overlays
+        screen: QScreen, Screen to cover
+        boards: list of int, Indices of the boards shown on this screen
+        """
         super().__init__()
         
         self.setWindowFlags(Qt.FramelessWindowHint | Qt.WindowStaysOnTopHint | Qt.Tool)
         self.setAttribute(Qt.WA_TranslucentBackground)
         self.setAttribute(Qt.WA_TransparentForMouseEvents)
 
-        app = QApplication.instance()
-        screens = app.screens()
-        
-        if len(screens) > MONITOR_ID - 1:
-            self.target_screen_geo = screens[MONITOR_ID - 1].geometry()
-            self.setGeometry(self.target_screen_geo)
-        else:
-            self.target_screen_geo = screens[0].geometry()
-            self.setGeometry(self.target_screen_geo)
-
-        self.target_rect = None
-        self.worker = GameWorker()
-        self.worker.solution_found.connect(self.update_rect)
-        self.worker.start()
+        self.target_screen_geo = screen.geometry()
+        self.setGeometry(self.target_screen_geo)
+
+        self.boards = set(boards)
+        self.target_rects = {}  # board index -> ranked list of QRect in window coordinates
+        self.hud_text = ""
+
+        # Paint resources are built once; rectangles are grouped per pen so one paint is
+        # one drawRects call per colour, however many moves are shown
+        self.pens = [QPen(QColor(*color), PEN_WIDTH) for color in RANK_COLORS]
+        self.no_brush = QBrush(Qt.NoBrush)
+        self.hud_pen = QPen(QColor(0, 255, 0))
+        self.hud_font = QFont("Consolas", 10)
+        self.rank_rects = [[] for _ in self.pens]
+        self.worker = worker
+        self.worker.solution_changed.connect(self.schedule_repaint)
+
+        # Changes are applied at most once per display refresh
+        refresh = screen.refreshRate() or 60.0
+        self.repaint_timer = QTimer(self)
+        self.repaint_timer.setSingleShot(True)
+        self.repaint_timer.setInterval(max(1, int(1000 / refresh)))
+        self.repaint_timer.timeout.connect(self.flush_rects)
+
+        self.show_hud = show_hud
+        if show_hud:
+            self.hud_timer = QTimer(self)
+            self.hud_timer.timeout.connect(self.update_hud)
+            self.hud_timer.start(500)
         self.show()
 
-    def update_rect(self, gx, gy, w, h):
-        if gx == -1:
-            self.target_rect = None
-        else:
-            local_x = gx - self.target_screen_geo.x()
-            local_y = gy - self.target_screen_geo.y()
-            self.target_rect = QRect(local_x, local_y, w, h)
-        self.update()
+    def update_hud(self):
+        if self.worker.metrics is None:
+            return
+        self.hud_text = self.worker.metrics.hud_text()
+        self.update(QRect(*HUD_RECT))
+
+    def schedule_repaint(self, board):
+        if board in self.boards and not self.repaint_timer.isActive():
+            self.repaint_timer.start()
+
+    def flush_rects(self):
+        """Take the latest rectangles and repaint only the area they left or entered"""
+        latest = self.worker.latest_rects()
+        left, top = self.target_screen_geo.x(), self.target_screen_geo.y()
+        dirty = QRect()
+        for board in self.boards:
+            new = [QRect(gx - left, gy - top, w, h) for gx, gy, w, h in latest.get(board, ())]
+            old = self.target_rects.get(board, [])
+            if new == old:
+                continue
+            for rect in old + new:
+                dirty = dirty.united(self._paint_bounds(rect))
+            self.target_rects[board] = new
+        if dirty.isNull():
+            return
+
+        last = len(self.pens) - 1
+        self.rank_rects = [[] for _ in self.pens]
+        for rects in self.target_rects.values():
+            for rank, rect in enumerate(rects):
+                self.rank_rects[min(rank, last)].append(rect)
+        self.update(dirty)
+
+    @staticmethod
+    def _paint_bounds(rect):
+        # The pen is centered on the rectangle edge, plus one pixel of rounding
+        margin = PEN_WIDTH // 2 + 2
+        return rect.adjusted(-margin, -margin, margin, margin)
 
     def paintEvent(self, event):
-        if self.target_rect:
-            painter = QPainter(self)
-            painter.setRenderHint(QPainter.Antialiasing)
-            pen = QPen(QColor(255, 0, 0), 5) 
-            painter.setPen(pen)
-            painter.setBrush(Qt.NoBrush) 
-            painter.drawRect(self.target_rect)
+        has_rects = any(self.rank_rects)
+        if not has_rects and not self.hud_text:
+            return
+        painter = QPainter(self)
+        if has_rects:
+            painter.setBrush(self.no_brush)
+            # Worst rank first so the best move is drawn on top
+            for pen, rects in zip(reversed(self.pens), reversed(self.rank_rects)):
+                if rects:
+                    painter.setPen(pen)
+                    painter.drawRects(rects)
+
+        if self.hud_text:
+            painter.setPen(self.hud_pen)
+            painter.setFont(self.hud_font)
+            painter.drawText(QRect(*HUD_RECT), Qt.AlignLeft | Qt.AlignTop, self.hud_text)
 
     def closeEvent(self, event):
         self.worker.stop()
@@ -204,7 +223,30 @@ def main():
         pass
 
     app = QApplication(sys.argv)
-    overlay = GameOverlay()
+    worker = GameWorker()
+
+    # Every screen gets its window right away; they learn their boards once the engine is built
+    screens = app.screens()
+    overlays = [GameOverlay(worker, screen, [], show_hud=SHOW_HUD and i == 0)
+                for i, screen in enumerate(screens)]
+
+    def assign_boards(boards):
+        by_screen = {}
+        for board, monitor_id in boards:
+            index = monitor_id - 1 if len(screens) > monitor_id - 1 else 0
+            by_screen.setdefault(index, set()).add(board)
+        for index, overlay in enumerate(overlays):
+            overlay.boards = by_screen.get(index, set())
+            if not overlay.boards and not overlay.show_hud:
+                overlay.hide()
+
+    def engine_failed(message):
+        # Nothing to draw without an engine: close the overlays instead of leaving them up idle
+        app.exit(1)
+
+    worker.engine_ready.connect(assign_boards)
+    worker.engine_failed.connect(engine_failed)
+    worker.start()
     sys.exit(app.exec_())
 
 if __name__ == '__main__':
@@ -0,0 +1,113 @@
+# metrics.py
+import json
+import time
+import numpy as np
+
+def _no_clock():
+    return 0.0
+
+class Metrics:
+    def __init__(self, enabled=True, window=1024, log_file=None, log_interval=5.0, clock=time.perf_counter):
+        """
+        enabled: bool, When False every method returns immediately
+        window: int, Number of recent samples kept per stage for the percentiles
+        log_file: str, JSON-lines file the snapshot is appended to every log_interval seconds
+        clock: callable, Time source of the stage timings (perf_counter for wall time,
+               thread_time for CPU time)
+        """
+        self.enabled = enabled
+        self.window = window
+        self.log_file = log_file
+        self.log_interval = log_interval
+        # Disabled: the clock does not even ask the OS for the time
+        self.clock = clock if enabled else _no_clock
+
+        self._samples = {}  # name -> ring buffer of recent values
+        self._counts = {}   # name -> number of values ever recorded
+        self.counters = {}  # name -> running total
+        self.gauges = {}    # name -> latest value
+        self._timed = set() # histograms that hold durations
+        self._last_log = time.perf_counter()
+
+    def record(self, stage, start):
+        """Record the time elapsed since start (a value returned by self.clock) for a stage"""
+        if not self.enabled:
+            return
+        if stage not in self._timed:
+            self._timed.add(stage)
+        self.observe(stage, self.clock() - start)
+
+    def observe(self, name, value):
+        """Add one sample to the rolling histogram of name"""
+        if not self.enabled:
+            return
+        buf = self._samples.get(name)
+        if buf is None:
+            buf = np.zeros(self.window, dtype=np.float64)
+            self._samples[name] = buf
+            self._counts[name] = 0
+        n = self._counts[name]
+        buf[n % self.window] = value
+        self._counts[name] = n + 1
+
+    def count(self, name, n=1):
+        if not self.enabled:
+            return
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def gauge(self, name, value):
+        if not self.enabled:
+            return
+        self.gauges[name] = value
+
+    def snapshot(self):
+        """
+        Pull API: current statistics as a plain dict
+        histograms: {name: {"count", "mean", "p50", "p95", "p99"}}, times in seconds
+        """
+        histograms = {}
+        for name, buf in list(self._samples.items()):
+            n = self._counts[name]
+            values = buf[:min(n, self.window)]
+            if len(values) == 0:
+                continue
+            p50, p95, p99 = np.percentile(values, (50, 95, 99))
+            histograms[name] = {
+                "count": n,
+                "mean": float(values.mean()),
+                "p50": float(p50),
+                "p95": float(p95),
+                "p99": float(p99),
+            }
+        return {
+            "time": time.time(),
+            "histograms": histograms,
+            "counters": dict(self.counters),
+            "gauges": dict(self.gauges),
+        }
+
+    def maybe_log(self):
+        """Append a snapshot to log_file if log_interval has passed since the last one"""
+        if not self.enabled or not self.log_file:
+            return
+        now = time.perf_counter()
+        if now - self._last_log < self.log_interval:
+            return
+        self._last_log = now
+        with open(self.log_file, "a", encoding="utf-8") as f:
+            f.write(json.dumps(self.snapshot()) + "\n")
+
+    def hud_text(self):
+        """Short multi-line summary for the overlay"""
+        snap = self.snapshot()
+        lines = []
+        for name, value in snap["gauges"].items():
+            lines.append(f"{name}: {value:.2f}")
+        for name, h in snap["histograms"].items():
+            if name in self._timed:
+                lines.append(f"{name}: p50 {h['p50'] * 1000:.2f} / p95 {h['p95'] * 1000:.2f} / p99 {h['p99'] * 1000:.2f} ms")
+            else:
+                lines.append(f"{name}: p50 {h['p50']:.1f} / p95 {h['p95']:.1f} / p99 {h['p99']:.1f}")
+        for name, value in snap["counters"].items():
+            lines.append(f"{name}: {value}")
+        return "\n".join(lines)
@@ -0,0 +1,307 @@
+# pipeline.py
+import time
+from collections import namedtuple
+import cv2
+import numpy as np
+
+from frame_gate import FrameGate
+from cell_tracker import CellTracker, STABLE, SETTLED
+from metrics import Metrics
+from layout import load_layout
+
+# skipped: frame gate reported no change, move is the previous one
+# changed: at least one digit changed or a cell is still animating
+# move: (r1, c1, r2, c2) or None
+# grid: list of lists of the digits the move was computed from
+# moves: ranked list of the top_k moves, moves[0] is move
+FrameResult = namedtuple("FrameResult", ["skipped", "changed", "move", "grid", "moves"], defaults=((),))
+
+class BoardPipeline:
+    def __init__(self, matcher, solver, layout=None, diff_threshold=5, settle_frames=3, settle_ms=120,
+                 high_confidence=0.95, vote_window=5, recheck_low_ms=100, recheck_high_ms=3000,
+                 gate_enabled=True, gate_tolerance=8, metrics=None, top_k=1, predict=True):
+        """
+        Per-frame logic of GameWorker without Qt: gate -> cell diff -> OCR -> solve
+        matcher: TemplateMatcher, solver: Solver
+        layout: GridLayout, Cell geometry of the board frames (default: layouts.yaml default)
+        top_k: int, Number of ranked moves kept per frame (FrameResult.moves)
+        predict: bool, Solve the board left after the shown move ahead of time, and use it as soon as
+                 exactly those cells turn blank (skips their OCR, the settle wait and the solve)
+        Other arguments: see CellTracker and FrameGate
+        """
+        self.matcher = matcher
+        self.solver = solver
+        self.layout = layout if layout is not None else load_layout()
+        self.rows, self.cols = self.layout.rows, self.layout.cols
+
+        self.tracker = CellTracker(self.layout, diff_threshold=diff_threshold,
+                                   settle_frames=settle_frames, settle_ms=settle_ms,
+                                   high_confidence=high_confidence, vote_window=vote_window,
+                                   recheck_low_ms=recheck_low_ms, recheck_high_ms=recheck_high_ms)
+        self.frame_gate = FrameGate(tolerance=gate_tolerance, enabled=gate_enabled)
+        self.metrics = metrics if metrics is not None else Metrics(enabled=False)
+        self.top_k = max(1, top_k)
+
+        self.current_grid = self.tracker.digit
+        self.ocr_count = 0
+        self.first_run = True
+        self.last_move = None
+        self.last_moves = []
+        self.last_grid = None
+        self._pending = None
+        self._last_blocked = False
+
+        # Speculation on the shown move: cells it clears, board after it and that board's moves
+        self.predict = predict
+        self._cleared = None
+        self._next_grid = None
+        self._next_moves = None
+        self._hit = False
+        self._blank = None  # Cells confirmed empty by a prediction
+        self.prediction_misses = 0  # Frames where the board changed other than predicted
+
+    def process(self, img, now=None):
+        """
+        Run one BGR frame of the board region through the pipeline
+        now: float, Frame timestamp (seconds), defaults to time.perf_counter()
+        return: FrameResult
+        """
+        crops = self.begin(img, now)
+        if crops is None:
+            return self.skipped_result()
+        matches = []
+        if crops:
+            t = self.metrics.clock()
+            matches = self.matcher.recognize_crops_with_score(crops)
+            self.metrics.record("ocr", t)
+        return self.finish(matches)
+
+    def begin(self, img, now=None):
+        """
+        First half of process(): frame gate and cell diff.
+        Several pipelines can then recognize their crops in one shared matching pass.
+        return: list of grayscale OCR crops to recognize, None if the frame is skipped
+        """
+        metrics = self.metrics
+        clock = metrics.clock
+        tracker = self.tracker
+        if now is None:
+            now = time.perf_counter()
+
+        t = clock()
+        gray_full = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        metrics.record("gray", t)
+
+        # Unchanged frame: reuse the last solution without touching any cell
+        # (only when no cell is mid-animation or waiting for a re-check)
+        if (not self.first_run and not tracker.unsettled.any()
+                and now < tracker.next_recheck
+                and not self.frame_gate.is_changed(gray_full)):
+            metrics.count("frames_skipped")
+            # Idle frame: a good time to solve the predicted board
+            if self._cleared is not None and self._next_moves is None:
+                self._solve_prediction()
+            return None
+
+        # Check all cells at once, changed cells are only recognized again once they stop animating
+        t = clock()
+        states = tracker.update(gray_full, now)
+        metrics.record("diff", t)
+
+        # Settled cells, plus unchanged cells whose vote is still undecided
+        reads = [(r, c, SETTLED) for r, c in zip(*np.nonzero(states == SETTLED))]
+        if now >= tracker.next_recheck:
+            due = (states == STABLE) & (tracker.recheck_at <= now)
+            reads.extend((r, c, STABLE) for r, c in zip(*np.nonzero(due)))
+
+        if self.first_run:
+            self.frame_gate.is_changed(gray_full)
+        self.first_run = False
+
+        # Cells settled by the speculation are committed as empty here instead of being read
+        handled = self._keep_blanks(gray_full, states, now) if self._blank is not None else None
+        if self._cleared is not None:
+            hit = self._confirm_prediction(gray_full, states, now, handled)
+            if hit is not None:
+                handled = hit if handled is None else handled | hit
+        if handled is not None:
+            reads = [read for read in reads if not handled[read[0], read[1]]]
+
+        self._pending = (reads, now)
+        windows = self.layout.crop_slices
+        return [gray_full[windows[r][c]] for r, c, _ in reads]
+
+    def finish(self, matches):
+        """
+        Second half of process(): commit the readings of the crops returned by begin() and solve
+        matches: list of (digit, score), one per crop
+        return: FrameResult
+        """
+        metrics = self.metrics
+        tracker = self.tracker
+        reads, now = self._pending
+        self._pending = None
+
+        updated_count = self._commit_reads(reads, matches, now)
+        tracker.end_frame()
+        metrics.observe("cells_ocr", len(reads))
+
+        # Nothing changed since the last solve (e.g. only re-checks that confirmed the digits)
+        unsettled = bool(tracker.unsettled.any())
+        hit, self._hit = self._hit, False
+        if (updated_count == 0 and not hit and not unsettled and not self._last_blocked
+                and self.last_grid is not None):
+            metrics.count("frames")
+            return FrameResult(False, False, self.last_move, self.last_grid, self.last_moves)
+
+        grid = self.current_grid.tolist()
+        if hit and updated_count == 0 and not unsettled:
+            if self._next_moves is None:
+                self._solve_prediction()
+            if grid == self._next_grid:
+                # The board is the predicted one, its moves are already known
+                metrics.count("prediction_hits")
+                return self._set_result(grid, self._next_moves, blocked=False, changed=True)
+        if updated_count > 0 and self._cleared is not None:
+            # Some other cell changed, the prediction no longer applies
+            metrics.count("prediction_misses")
+            self.prediction_misses += 1
+            self._cleared = None
+
+        # Solve
+        t = metrics.clock()
+        blocked = tracker.unsettled if unsettled else None
+        moves = self._solve(grid, blocked)
+        metrics.record("solve", t)
+        changed = hit or updated_count > 0 or unsettled
+        return self._set_result(grid, moves, blocked=unsettled, changed=changed)
+
+    def _solve(self, grid, blocked=None):
+        """Ranked moves of grid (top_k of them), excluding rectangles over blocked cells"""
+        if self.top_k > 1:
+            moves = self.solver.top_moves(grid, self.top_k, blocked=blocked)
+        else:
+            move = self.solver.solve(grid, blocked=blocked)
+            moves = [move] if move else []
+        # Double check if the solutions are valid
+        return [m for m in moves if grid[m[0]][m[1]] != 0 and grid[m[2]][m[3]] != 0]
+
+    def _set_result(self, grid, moves, blocked, changed):
+        """Keep the solved board as the latest one, and speculate on its best move"""
+        move = moves[0] if moves else None
+        self._last_blocked = blocked
+        self.last_move = move
+        self.last_moves = moves
+        self.last_grid = grid
+        if self.predict and not blocked:
+            self._set_prediction(grid, move)
+        self.metrics.count("frames")
+        return FrameResult(False, changed, move, grid, moves)
+
+    # ---------- speculation ----------
+    def _set_prediction(self, grid, move):
+        """The player is expected to clear move: remember which cells that blanks and the board it leaves"""
+        self._cleared = None
+        self._next_moves = None
+        if move is None:
+            return
+        r1, c1, r2, c2 = move
+        rows = slice(min(r1, r2), max(r1, r2) + 1)
+        cols = slice(min(c1, c2), max(c1, c2) + 1)
+        board = np.array(grid, dtype=np.int8)
+        cleared = np.zeros(board.shape, dtype=bool)
+        cleared[rows, cols] = board[rows, cols] != 0
+        board[rows, cols] = 0
+        self._cleared = cleared
+        self._next_grid = board.tolist()
+
+    def _solve_prediction(self):
+        t = self.metrics.clock()
+        self._next_moves = self._solve(self._next_grid)
+        self.metrics.record("predict", t)
+
+    def _confirm_prediction(self, gray_full, states, now, handled=None):
+        """
+        Check the current frame against the predicted clear: the changed cells must be exactly the
+        cleared ones, and every one of them must already look blank
+        handled: bool mask of cells already dealt with by _keep_blanks (not counted as changed)
+        return: mask of the cleared cells if confirmed (they are then committed as empty), else None
+        """
+        cleared = self._cleared
+        dirty = states != STABLE
+        if handled is not None:
+            dirty &= ~handled
+        if not dirty.any():
+            return None
+        if (dirty & ~cleared).any():
+            # Something else changed: back to the normal path
+            self.metrics.count("prediction_misses")
+            self.prediction_misses += 1
+            self._cleared = None
+            return None
+        if not np.array_equal(dirty, cleared):
+            return None
+
+        windows = self.layout.crop_slices
+        cells = list(zip(*np.nonzero(cleared)))
+        if not all(self.matcher.is_blank(gray_full[windows[r][c]]) for r, c in cells):
+            # Still fading out (or not what we expected), wait for the next frame
+            return None
+        for r, c in cells:
+            self.tracker.commit(r, c, 0, 1.0, now)
+        self._blank = cleared if self._blank is None else self._blank | cleared
+        self._cleared = None
+        self._hit = True
+        return cleared
+
+    def _keep_blanks(self, gray_full, states, now):
+        """
+        Cells confirmed empty may keep changing a little (the end of the fade-out): while they still
+        look blank they are committed as empty again, so they neither block the solver nor get read
+        return: bool mask of the cells handled this way
+        """
+        blank = self._blank
+        handled = np.zeros(blank.shape, dtype=bool)
+        windows = self.layout.crop_slices
+        for r, c in zip(*np.nonzero(blank & (states != STABLE))):
+            if self.matcher.is_blank(gray_full[windows[r][c]]):
+                self.tracker.commit(r, c, 0, 1.0, now)
+                handled[r, c] = True
+            else:
+                # A new digit arrived, back to the normal path
+                blank[r, c] = False
+        return handled
+
+    def skipped_result(self):
+        """Result of a frame skipped by begin(): the previous move"""
+        return FrameResult(True, False, self.last_move, self.last_grid, self.last_moves)
+
+    def _commit_reads(self, reads, matches, now):
+        """
+        Record the readings of the listed cells
+        reads: list of (r, c, state)
+        return: number of cells whose image or digit changed
+        """
+        self.ocr_count += len(reads)
+        updated = 0
+        for (r, c, state), (num, score) in zip(reads, matches):
+            # The digit used is the vote over recent readings
+            old = self.current_grid[r, c]
+            num = self.tracker.commit(r, c, num, score, now, fresh=(state == SETTLED))
+            if state == SETTLED or num != old:
+                updated += 1
+        return updated
+
+    def move_rect(self, move, base_x=0, base_y=0):
+        """
+        Convert a move to a pixel rectangle (x, y, w, h), offset by (base_x, base_y)
+        return: (-1, -1, 0, 0) if move is None
+        """
+        if not move:
+            return (-1, -1, 0, 0)
+        return self.layout.rect(*move, base_x=base_x, base_y=base_y)
+
+    def move_rects(self, moves, base_x=0, base_y=0):
+        """Pixel rectangles of a ranked move list"""
+        rect = self.layout.rect
+        return [rect(*move, base_x=base_x, base_y=base_y) for move in moves]
@@ -0,0 +1,190 @@
+# profiler.py
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+PROFILE_ENV = "NIKKE_PROFILE"      # e.g. NIKKE_PROFILE=10: profile the first 10 seconds of the worker
+TRIGGER_FILE = "profile.trigger"   # Create this file (optionally containing seconds) to profile a running worker
+PROFILE_DIR = "profiles"           # Where the .folded and .stages.json files are written
+DEFAULT_SECONDS = 10.0
+DEFAULT_INTERVAL_MS = 2.0          # Time between two samples
+POLL_INTERVAL = 1.0                # How often the worker looks for the trigger file (seconds)
+
+# (file, function) -> stage; a sample belongs to the outermost stage function on its stack
+STAGE_FUNCTIONS = {
+    ("screen_shot.py", "capture"): "capture",
+    ("frame_gate.py", "is_changed"): "gate",
+    ("cell_tracker.py", "update"): "diff",
+    ("template_matcher.py", "recognize_crops_with_score"): "ocr",
+    ("template_matcher.py", "recognize_grids"): "ocr",
+    ("template_matcher.py", "_match_features"): "ocr",
+    ("pipeline.py", "_commit_reads"): "commit",
+    ("pipeline.py", "_confirm_prediction"): "commit",
+    ("pipeline.py", "_keep_blanks"): "commit",
+    ("cell_tracker.py", "end_frame"): "commit",
+    ("pipeline.py", "_solve"): "solve",
+    ("pipeline.py", "_solve_prediction"): "predict",
+    ("engine.py", "_publish"): "emit",
+    ("scheduler.py", "wait"): "idle",
+}
+
+class SamplingProfiler:
+    def __init__(self, thread_id, seconds=DEFAULT_SECONDS, interval_ms=DEFAULT_INTERVAL_MS, out_dir=PROFILE_DIR):
+        """
+        Sample the Python stack of one thread from a helper thread, nothing is hooked into the target
+        thread_id: int, threading.get_ident() of the thread to profile
+        Writes <out_dir>/profile_<time>.folded (collapsed stacks, first frame is the stage, for
+        flamegraph.pl / speedscope) and a .stages.json summary with the time per stage
+        """
+        self.thread_id = thread_id
+        self.seconds = seconds
+        self.interval = interval_ms / 1000.0
+        self.out_dir = out_dir
+        self.stacks = Counter()
+        self.samples = 0
+        self.elapsed = 0.0
+        self.path = None
+        self._frames = {}  # code object -> (label, stage)
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="SamplingProfiler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """End the profile early, the file is still written"""
+        self._stop.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+
+    def _run(self):
+        start = time.perf_counter()
+        end = start + self.seconds
+        while not self._stop.is_set() and time.perf_counter() < end:
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                break  # The profiled thread has ended
+            self._sample(frame)
+            del frame
+            self._stop.wait(self.interval)
+        self.elapsed = time.perf_counter() - start
+        self.write()
+
+    def _describe(self, code):
+        info = self._frames.get(code)
+        if info is None:
+            filename = os.path.basename(code.co_filename)
+            info = (f"{os.path.splitext(filename)[0]}.{code.co_name}",
+                    STAGE_FUNCTIONS.get((filename, code.co_name)))
+            self._frames[code] = info
+        return info
+
+    def _sample(self, frame):
+        labels = []
+        stage = None
+        while frame is not None:
+            label, frame_stage = self._describe(frame.f_code)
+            labels.append(label)
+            if frame_stage is not None:
+                stage = frame_stage  # Walking leaf to root, so the outermost one is kept
+            frame = frame.f_back
+        labels.append(stage or "other")
+        labels.reverse()
+        self.stacks[";".join(labels)] += 1
+        self.samples += 1
+
+    def stage_times(self):
+        """{stage: {"samples", "seconds", "share"}}, seconds estimated from the real sampling rate"""
+        per_sample = self.elapsed / self.samples if self.samples else 0.0
+        counts = Counter()
+        for stack, n in self.stacks.items():
+            counts[stack.split(";", 1)[0]] += n
+        return {stage: {"samples": n, "seconds": n * per_sample, "share": n / self.samples}
+                for stage, n in counts.most_common()}
+
+    def write(self):
+        os.makedirs(self.out_dir, exist_ok=True)
+        base = os.path.join(self.out_dir, time.strftime("profile_%Y%m%d_%H%M%S"))
+        with open(base + ".folded", "w", encoding="utf-8") as f:
+            for stack, n in self.stacks.most_common():
+                f.write(f"{stack} {n}\n")
+        stages = self.stage_times()
+        with open(base + ".stages.json", "w", encoding="utf-8") as f:
+            json.dump({"seconds": self.elapsed, "samples": self.samples, "stages": stages}, f, indent=2)
+        self.path = base + ".folded"
+
+        print(f"效能取樣完成: {self.samples} 個樣本 / {self.elapsed:.1f} 秒 -> {self.path}")
+        for stage, s in stages.items():
+            print(f"  {stage:8s} {s['seconds'] * 1000:9.1f} ms  {s['share'] * 100:5.1f}%")
+
+class ProfileTrigger:
+    def __init__(self, path=TRIGGER_FILE, env=PROFILE_ENV, poll_interval=POLL_INTERVAL,
+                 interval_ms=DEFAULT_INTERVAL_MS, out_dir=PROFILE_DIR):
+        """
+        Starts a SamplingProfiler on the thread that calls poll(), when the environment variable is
+        set at start-up or when the trigger file appears. While idle, poll() is one comparison per
+        call and one file check per poll_interval.
+        """
+        self.path = path
+        self.poll_interval = poll_interval
+        self.interval_ms = interval_ms
+        self.out_dir = out_dir
+        self.profiler = None
+        self._next_poll = 0.0
+        self._pending = self._parse_seconds(os.environ.get(env, "")) if env else None
+
+    @staticmethod
+    def _parse_seconds(text):
+        text = text.strip()
+        if not text:
+            return None
+        try:
+            return float(text)
+        except ValueError:
+            return DEFAULT_SECONDS
+
+    def poll(self, now):
+        """now: float, time.perf_counter() of the caller's loop"""
+        if now < self._next_poll:
+            return
+        self._next_poll = now + self.poll_interval
+        if self.profiler is not None and self.profiler.running:
+            return
+
+        seconds, self._pending = self._pending, None
+        if seconds is None and self.path and os.path.exists(self.path):
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    seconds = self._parse_seconds(f.read()) or DEFAULT_SECONDS
+                os.remove(self.path)
+            except OSError:
+                return
+        if seconds:
+            print(f"效能取樣開始: {seconds:g} 秒")
+            self.profiler = SamplingProfiler(threading.get_ident(), seconds, self.interval_ms,
+                                             self.out_dir).start()
+
+    def stop(self):
+        if self.profiler is not None and self.profiler.running:
+            self.profiler.stop()
+
+if __name__ == "__main__":
+    # Ask a running worker (same working directory) for a profile
+    import argparse
+
+    parser = argparse.ArgumentParser(description="要求執行中的程式進行效能取樣 (建立觸發檔)")
+    parser.add_argument("seconds", nargs="?", type=float, default=DEFAULT_SECONDS)
+    parser.add_argument("--trigger", default=TRIGGER_FILE, help="觸發檔路徑")
+    args = parser.parse_args()
+    with open(args.trigger, "w", encoding="utf-8") as f:
+        f.write(f"{args.seconds}\n")
+    print(f"已建立 {args.trigger}，一秒內開始取樣 {args.seconds:g} 秒，結果寫入 {PROFILE_DIR}/")
@@ -0,0 +1,282 @@
+# recognition_service.py
+import asyncio
+import base64
+import concurrent.futures
+import json
+import os
+import socket
+import sys
+import time
+import cv2
+import numpy as np
+
+from template_matcher import TemplateMatcher
+from solver import Solver
+from layout import load_layout
+
+DEFAULT_SOCKET = "/tmp/nikke_recognition.sock"
+DEFAULT_PORT = 8765
+BATCH_WINDOW_MS = 5   # Requests arriving within this window share one matching pass
+MAX_BATCH = 32        # ... up to this many boards
+MAX_MOVES = 10        # Default number of ranked moves returned per board
+
+def decode_image(request):
+    """request: dict with "image" (base64 PNG/JPG bytes) or "path" (local file)"""
+    if "image" in request:
+        data = np.frombuffer(base64.b64decode(request["image"]), dtype=np.uint8)
+        img = cv2.imdecode(data, cv2.IMREAD_COLOR)
+    elif "path" in request:
+        img = cv2.imread(request["path"])
+    else:
+        raise ValueError("需要 image 或 path")
+    if img is None:
+        raise ValueError("無法解碼圖片")
+    return img
+
+def check_request(request):
+    """
+    Reject a malformed request before it joins a batch
+    request: parsed JSON line, must be an object; "moves" (optional) a non-negative int
+    """
+    if not isinstance(request, dict):
+        raise ValueError("請求必須是 JSON 物件")
+    moves = request.get("moves", MAX_MOVES)
+    if isinstance(moves, bool) or not isinstance(moves, int) or moves < 0:
+        raise ValueError(f"moves 必須是非負整數: {moves!r}")
+    if "image" in request and not isinstance(request["image"], str):
+        raise ValueError("image 必須是 base64 字串")
+    if "path" in request and not isinstance(request["path"], str):
+        raise ValueError("path 必須是字串")
+
+def check_image(img, layout):
+    """The board image must be a color or gray image with at least one pixel per cell"""
+    if img.ndim not in (2, 3) or img.shape[0] < layout.rows or img.shape[1] < layout.cols:
+        raise ValueError(f"圖片尺寸不符: {img.shape}，盤面為 {layout.rows}x{layout.cols}")
+
+class RecognitionService:
+    def __init__(self, templates_file='digits.pkl', layout=None,
+                 batch_window_ms=BATCH_WINDOW_MS, max_batch=MAX_BATCH):
+        """
+        One warm TemplateMatcher + Solver shared by every client
+        Requests are newline-delimited JSON: {"id": any, "image": base64 or "path": str, "moves": int}
+        Responses: {"id", "grid", "moves"} or {"id", "error"}
+        layout: GridLayout, Grid of the board images (spread over each image's size), default from layouts.yaml
+        batch_window_ms: float, How long the first request of a batch waits for others
+        """
+        self.matcher = TemplateMatcher(templates_file=templates_file, dont_save_unknowns=True, verbose=False)
+        self.solver = Solver(target_sum=10)
+        self.layout = layout if layout is not None else load_layout()
+        self.batch_window = batch_window_ms / 1000.0
+        self.max_batch = max_batch
+
+        # A single worker thread owns the matcher, so its caches are never shared across threads
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        self._queue = None
+        self._server = None
+        self.requests = 0
+        self.batches = 0
+
+    # ---------- batching ----------
+    async def _batcher(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.batch_window
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            try:
+                results = await loop.run_in_executor(self._executor, self._process_batch,
+                                                     [request for request, _ in batch])
+            except Exception as e:
+                results = [{"error": str(e)}] * len(batch)
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+
+    def _process_batch(self, requests):
+        """
+        Runs on the worker thread: decode all boards, match their cells together, then solve
+        Errors are per request: a bad board only fails its own reply
+        """
+        self.batches += 1
+        results = [None] * len(requests)
+        imgs, slots = [], []
+        for i, request in enumerate(requests):
+            try:
+                img = decode_image(request)
+                check_image(img, self.layout)
+                imgs.append(img)
+                slots.append(i)
+            except Exception as e:
+                results[i] = {"error": str(e)}
+
+        try:
+            grids = self.matcher.recognize_grids(imgs, layout=self.layout) if imgs else []
+        except Exception:
+            # Find the board that broke the shared pass, the others are still answered
+            grids = []
+            for i, img in zip(slots, imgs):
+                try:
+                    grids.append(self.matcher.recognize_grid(img, layout=self.layout))
+                except Exception as e:
+                    results[i] = {"error": str(e)}
+                    grids.append(None)
+
+        for i, grid in zip(slots, grids):
+            if grid is None:
+                continue
+            try:
+                limit = requests[i].get("moves", MAX_MOVES)
+                moves = self.solver.find_all_moves(grid) if limit else []
+                results[i] = {"grid": grid, "moves": [list(m) for m in moves[:limit]]}
+            except Exception as e:
+                results[i] = {"error": str(e)}
+        return results
+
+    async def submit(self, request):
+        """Queue one request dict, return its response dict"""
+        future = asyncio.get_running_loop().create_future()
+        self.requests += 1
+        await self._queue.put((request, future))
+        return await future
+
+    # ---------- connections ----------
+    async def _handle(self, reader, writer):
+        pending = set()
+        lock = asyncio.Lock()
+
+        async def answer(line):
+            # Every line gets a reply, even when it cannot be parsed or processed
+            request_id = None
+            try:
+                request = json.loads(line)
+                if isinstance(request, dict):
+                    request_id = request.get("id")
+                check_request(request)
+                response = {"id": request_id, **await self.submit(request)}
+            except json.JSONDecodeError as e:
+                response = {"id": None, "error": f"JSON 格式錯誤: {e}"}
+            except Exception as e:
+                response = {"id": request_id, "error": str(e)}
+            async with lock:
+                writer.write((json.dumps(response) + "\n").encode())
+                await writer.drain()
+
+        try:
+            # Requests of one connection are answered as they finish, matched by "id"
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                if line.strip():
+                    task = asyncio.create_task(answer(line))
+                    pending.add(task)
+                    task.add_done_callback(pending.discard)
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, path=None, host="127.0.0.1", port=None):
+        """
+        Listen on a Unix domain socket (path) or on localhost TCP (port) until cancelled
+        """
+        self._queue = asyncio.Queue()
+        batcher = asyncio.create_task(self._batcher())
+        if port is not None:
+            self._server = await asyncio.start_server(self._handle, host, port)
+            where = f"{host}:{port}"
+        else:
+            if os.path.exists(path):
+                os.remove(path)
+            self._server = await asyncio.start_unix_server(self._handle, path)
+            where = path
+        print(f"辨識服務啟動: {where}")
+        try:
+            async with self._server:
+                await self._server.serve_forever()
+        finally:
+            batcher.cancel()
+            self._executor.shutdown(wait=False)
+            if port is None and os.path.exists(path):
+                os.remove(path)
+
+class RecognitionClient:
+    def __init__(self, path=DEFAULT_SOCKET, host="127.0.0.1", port=None, timeout=10.0):
+        """Blocking client for tools that are not asyncio based"""
+        if port is not None:
+            self.sock = socket.create_connection((host, port), timeout=timeout)
+        else:
+            self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.sock.settimeout(timeout)
+            self.sock.connect(path)
+        self.file = self.sock.makefile("rb")
+        self.next_id = 0
+
+    def recognize(self, img=None, path=None, moves=MAX_MOVES):
+        """
+        img: BGR board image, or path: image file readable by the service
+        return: response dict {"id", "grid", "moves"} or {"id", "error"}
+        """
+        request = {"id": self.next_id, "moves": moves}
+        self.next_id += 1
+        if img is not None:
+            ok, data = cv2.imencode(".png", img)
+            request["image"] = base64.b64encode(data.tobytes()).decode("ascii")
+        else:
+            request["path"] = os.path.abspath(path)
+        self.sock.sendall((json.dumps(request) + "\n").encode())
+        return json.loads(self.file.readline())
+
+    def close(self):
+        self.file.close()
+        self.sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="本機辨識服務: 常駐載入模板庫，以 JSON lines 回傳盤面與解")
+    parser.add_argument("--socket", default=DEFAULT_SOCKET, help="Unix domain socket 路徑")
+    parser.add_argument("--port", type=int, help="改用 localhost TCP 連接埠")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--templates", default="digits.pkl")
+    parser.add_argument("--layout", help="版面名稱 (layouts.yaml，預設為檔案中的 default)")
+    parser.add_argument("--batch-window", type=float, default=BATCH_WINDOW_MS, help="合併請求的等待時間 (毫秒)")
+    parser.add_argument("--max-batch", type=int, default=MAX_BATCH, help="一次最多合併幾張盤面")
+    args = parser.parse_args()
+
+    if args.port is None and not hasattr(socket, "AF_UNIX"):
+        args.port = DEFAULT_PORT
+    try:
+        layout = load_layout(args.layout)
+    except ValueError as e:
+        parser.error(str(e))
+    service = RecognitionService(templates_file=args.templates, layout=layout,
+                                 batch_window_ms=args.batch_window,
+                                 max_batch=args.max_batch)
+    start = time.perf_counter()
+    try:
+        asyncio.run(service.serve(path=args.socket, host=args.host, port=args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        elapsed = time.perf_counter() - start
+        print(f"\n共處理 {service.requests} 個請求，{service.batches} 批，運行 {elapsed:.0f} 秒", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
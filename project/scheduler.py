@@ -0,0 +1,104 @@
+# scheduler.py
+import time
+
+class FrameScheduler:
+    def __init__(self, min_interval=0.005, max_interval=0.25, backoff=1.5, error_interval=1.0):
+        """
+        min_interval: float, Shortest wait between captures (seconds), used while the board is changing
+        max_interval: float, Longest wait between captures (seconds), reached after a long idle period
+        backoff: float, Multiplier applied to the interval for every idle frame
+        error_interval: float, Upper bound of the wait after consecutive errors
+        """
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.error_interval = error_interval
+
+        self.interval = min_interval
+        self.error_streak = 0
+        self.wakes = 0  # Idle waits ended early by wake()
+
+        # Exponential moving averages used for the exposed metrics
+        self._last_tick = None
+        self._frame_period = None
+        self._change_ratio = 0.0
+
+    def on_frame(self, changed):
+        """
+        Report the result of one processed frame, return the wait time before the next capture
+        changed: bool, Whether the board changed in this frame
+        """
+        now = time.perf_counter()
+        if self._last_tick is not None:
+            period = now - self._last_tick
+            if self._frame_period is None:
+                self._frame_period = period
+            else:
+                self._frame_period += 0.1 * (period - self._frame_period)
+        self._last_tick = now
+        self._change_ratio += 0.1 * ((1.0 if changed else 0.0) - self._change_ratio)
+        self.error_streak = 0
+
+        if changed:
+            # Speed up right away, the next frames are likely to change too
+            self.interval = self.min_interval
+        else:
+            self.interval = min(self.interval * self.backoff, self.max_interval)
+        return self.interval
+
+    def on_error(self):
+        """
+        Report a failed frame, return the wait time (grows exponentially up to error_interval)
+        """
+        self.error_streak += 1
+        delay = self.min_interval * (2 ** self.error_streak)
+        return min(max(delay, self.interval), self.error_interval)
+
+    def wait(self, delay, should_continue=None, wake=None, wake_interval=0.04):
+        """
+        Sleep for delay seconds, in small steps so a stop request is not held back by a long idle wait
+        should_continue: callable returning False to abort the wait early
+        wake: callable returning True when the board changed (a cheap probe), called every wake_interval
+              seconds; ends the wait and drops the interval back to min_interval
+        """
+        now = time.perf_counter()
+        deadline = now + delay
+        next_wake = now + wake_interval
+        while True:
+            now = time.perf_counter()
+            remaining = deadline - now
+            if remaining <= 0:
+                return
+            if should_continue is not None and not should_continue():
+                return
+            step = min(remaining, 0.05)
+            if wake is not None:
+                if now >= next_wake:
+                    next_wake = now + wake_interval
+                    if wake():
+                        self.wakes += 1
+                        self.interval = self.min_interval
+                        return
+                step = min(step, next_wake - now)
+            time.sleep(step)
+
+    @property
+    def rate(self):
+        """Current capture rate (frames per second)"""
+        if not self._frame_period:
+            return 0.0
+        return 1.0 / self._frame_period
+
+    @property
+    def change_ratio(self):
+        """Recent fraction of frames in which the board changed"""
+        return self._change_ratio
+
+if __name__ == "__main__":
+    sched = FrameScheduler(min_interval=0.005, max_interval=0.25)
+    pattern = [True] * 3 + [False] * 12 + [True] + [False] * 3
+    for changed in pattern:
+        delay = sched.on_frame(changed)
+        print(f"changed={changed!s:5}  下次擷取等待 {delay * 1000:6.1f} ms")
+        sched.wait(delay)
+    print(f"擷取頻率: {sched.rate:.1f} fps, 變化比例: {sched.change_ratio:.2f}")
@@ -1,15 +1,50 @@
 # screen_shot.py
+import json
+import os
+import time
 import cv2
 import numpy as np
-import mss
 
-class ScreenCapture:
+class CaptureSource:
+    """
+    Common interface of all frame sources used by GameWorker
+    """
+    def capture(self):
+        """Return the next frame as an OpenCV BGR image"""
+        raise NotImplementedError
+
+    def capture_regions(self, rects, out):
+        """
+        Capture only some rectangles of the next frame into out, the rest of out is left as is
+        rects: list of (x, y, w, h) in frame coordinates
+        out: BGR image of the full frame size, written in place
+        The default grabs the whole frame, so recordings replay the same way a partial grab would look
+        """
+        frame = self.capture()
+        for x, y, w, h in rects:
+            out[y:y + h, x:x + w] = frame[y:y + h, x:x + w]
+
+    def monitor_offset(self):
+        """Return (left, top) of the captured monitor in global desktop coordinates"""
+        return 0, 0
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class ScreenCapture(CaptureSource):
     def __init__(self, monitor_idx=1, region=None):
         """
         monitor_idx: int, Monitor index (1 for main, 2 for secondary...)
         region: tuple (x, y, w, h), Coordinates relative to the screen's top-left corner.
                 If not provided, capture the full screen.
         """
+        import mss
         self.sct = mss.mss()
         self.monitor_idx = monitor_idx
         self.region = region
@@ -23,6 +58,11 @@ class ScreenCapture:
         """
         Capture specified region of specified monitor, return OpenCV BGR image
         """
+        # Remove Alpha channel (BGRA -> BGR), OpenCV usually doesn't need transparency
+        return cv2.cvtColor(self.capture_raw(), cv2.COLOR_BGRA2BGR)
+
+    def capture_raw(self):
+        """One grab as a BGRA array without any conversion (idle probes only look at a few pixels)"""
         # Get specified monitor info (including left, top offsets)
         monitor = self.sct.monitors[self.monitor_idx]
         
@@ -42,16 +82,267 @@ class ScreenCapture:
 
         # Capture screen
         sct_img = self.sct.grab(capture_area)
-        
-        # Convert to Numpy array (mss returns BGRA, including alpha)
-        frame = np.array(sct_img)
-        
-        # Remove Alpha channel (BGRA -> BGR), OpenCV usually doesn't need transparency
-        frame = cv2.cvtColor(frame, cv2.COLOR_BGRA2BGR)
-        
+
+        # Numpy view of the pixels (mss returns BGRA, including alpha)
+        return np.asarray(sct_img)
+
+    def capture_regions(self, rects, out):
+        """Grab each rectangle (relative to the region) on its own, straight into out"""
+        monitor = self.sct.monitors[self.monitor_idx]
+        left = monitor["left"] + (self.region[0] if self.region else 0)
+        top = monitor["top"] + (self.region[1] if self.region else 0)
+        for x, y, w, h in rects:
+            sct_img = self.sct.grab({"top": top + y, "left": left + x, "width": w, "height": h,
+                                     "mon": self.monitor_idx})
+            out[y:y + h, x:x + w] = np.asarray(sct_img)[:, :, :3]
+
+    def monitor_offset(self):
+        monitor = self.sct.monitors[self.monitor_idx]
+        return monitor["left"], monitor["top"]
+
+    def close(self):
+        self.sct.close()
+
+class RoiCapture(CaptureSource):
+    def __init__(self, source, full_interval=0.25, hold=0.5, margin=4, probes=(), probe_tolerance=8,
+                 min_ticks=50, clock=time.perf_counter):
+        """
+        Capture scheduler: between full grabs, only the regions where a change is expected (set_rois)
+        are grabbed and written into one persistent frame buffer
+        source: CaptureSource, Supplies the pixels (capture / capture_regions)
+        full_interval: float, Seconds between two full grabs, which catch changes outside the regions
+        hold: float, Seconds a region is still grabbed after it was last asked for (refill after a clear)
+        margin: int, Pixels added around every region
+        probes: list of (x, y, w, h), Small regions grabbed with every region grab (e.g.
+                GridLayout.probe_rects); a difference there turns the grab into a full one, so a change
+                outside the regions is not held back until the next full grab
+        probe_tolerance: int, Largest probe pixel difference (0~255) still treated as unchanged
+        min_ticks: int, Region ticks timed before comparing their cost with full grabs: every grab call
+                   has a fixed overhead (mss), so several small grabs can cost more than one full grab;
+                   if they do, only full grabs are taken from then on
+        clock: callable, Time source of full_interval and hold
+        """
+        self.source = source
+        self.full_interval = full_interval
+        self.hold = hold
+        self.margin = margin
+        self.probes = list(probes)
+        self.probe_tolerance = probe_tolerance
+        self.min_ticks = min_ticks
+        self.clock = clock
+        self.enabled = True    # False once region ticks turned out slower than full grabs
+        self.frame = None
+        self.rois = []
+        self.full_grabs = 0
+        self.roi_grabs = 0
+        self.probe_hits = 0    # Region grabs turned into full grabs by the probes
+        self.pixels = 0        # Pixels grabbed in total
+        self.full_pixels = 0   # Pixels full grabs would have taken
+        self.full_seconds = 0.0  # Wall time of the full grabs (source.capture only)
+        self.roi_seconds = 0.0   # Wall time of the region ticks (probes and regions)
+        self._expiry = {}      # roi -> time it stops being grabbed
+        self._next_full = 0.0
+        self._full_requested = True
+        self._probe_frame = None
+
+    def set_rois(self, rects, renew=False):
+        """
+        rects: list of (x, y, w, h) in frame coordinates; no region left means full grabs only
+        renew: bool, Also keep every current region for another hold seconds (e.g. cells still animating)
+        """
+        if self.frame is None:
+            return
+        now = self.clock()
+        height, width = self.frame.shape[:2]
+        m = self.margin
+        expiry = self._expiry
+        if renew:
+            for roi in expiry:
+                expiry[roi] = now + self.hold
+        for x, y, w, h in rects:
+            x1, y1 = max(0, x - m), max(0, y - m)
+            x2, y2 = min(width, x + w + m), min(height, y + h + m)
+            if x2 > x1 and y2 > y1:
+                expiry[(x1, y1, x2 - x1, y2 - y1)] = now + self.hold
+        for roi in [roi for roi, until in expiry.items() if until <= now]:
+            del expiry[roi]
+        self.rois = list(expiry)
+
+    def request_full(self):
+        """Take a full grab on the next capture (e.g. the regions showed an unexpected change)"""
+        self._full_requested = True
+
+    def _probes_changed(self):
+        """Grab the probes and compare them with the held frame"""
+        if self._probe_frame is None or self._probe_frame.shape != self.frame.shape:
+            self._probe_frame = np.empty_like(self.frame)
+        self.source.capture_regions(self.probes, self._probe_frame)
+        self.pixels += sum(w * h for _, _, w, h in self.probes)
+        for x, y, w, h in self.probes:
+            window = (slice(y, y + h), slice(x, x + w))
+            if cv2.absdiff(self._probe_frame[window], self.frame[window]).max() > self.probe_tolerance:
+                self.probe_hits += 1
+                return True
+        return False
+
+    def capture(self):
+        now = self.clock()
+        full = not self.enabled or self._full_requested or not self.rois or now >= self._next_full
+        start = time.perf_counter()
+        if not full and self.probes:
+            full = self._probes_changed()
+            if full:
+                self.roi_seconds += time.perf_counter() - start
+        if full:
+            t = time.perf_counter()
+            frame = self.source.capture()
+            self.full_seconds += time.perf_counter() - t
+            if self.frame is None or self.frame.shape != frame.shape:
+                self.frame = np.empty(frame.shape, dtype=np.uint8)
+                self.rois = []
+                self._expiry = {}
+            self.frame[...] = frame
+            self._next_full = now + self.full_interval
+            self._full_requested = False
+            self.full_grabs += 1
+            self.pixels += frame.shape[0] * frame.shape[1]
+        else:
+            self.source.capture_regions(self.rois, self.frame)
+            self.roi_seconds += time.perf_counter() - start
+            self.roi_grabs += 1
+            self.pixels += sum(w * h for _, _, w, h in self.rois)
+            if self.roi_grabs == self.min_ticks and self.time_ratio >= 1.0:
+                self.enabled = False
+                print(f"區域擷取比整張擷取慢 (時間比 {self.time_ratio:.2f})，改為整張擷取")
+        self.full_pixels += self.frame.shape[0] * self.frame.shape[1]
+        return self.frame
+
+    @property
+    def pixel_ratio(self):
+        """Pixels grabbed / pixels full grabs would have taken"""
+        return self.pixels / self.full_pixels if self.full_pixels else 1.0
+
+    @property
+    def time_ratio(self):
+        """
+        Measured grab time / time full grabs would have taken (mean full grab x ticks), the actual
+        saving: per-call overhead makes it higher than pixel_ratio
+        """
+        if not self.full_grabs:
+            return 1.0
+        full = self.full_seconds / self.full_grabs * (self.full_grabs + self.roi_grabs)
+        return (self.full_seconds + self.roi_seconds) / full if full > 0 else 1.0
+
+    def monitor_offset(self):
+        return self.source.monitor_offset()
+
+    def close(self):
+        self.source.close()
+
+class FrameRecorder(CaptureSource):
+    def __init__(self, source, path):
+        """
+        Pass-through source that also stores every frame on disk
+        source: CaptureSource, Where the frames come from
+        path: str, Recording name, creates <path>.frames (raw BGR), <path>.ts (float64 timestamps)
+              and <path>.json (frame shape and monitor offset)
+        """
+        self.source = source
+        self.path = path
+        self.count = 0
+        self.shape = None
+        self._frames = open(path + ".frames", "wb")
+        self._ts = open(path + ".ts", "wb")
+
+    def capture(self):
+        frame = self.source.capture()
+        ts = time.perf_counter()
+        if self.shape is None:
+            self.shape = frame.shape
+            self._write_header()
+        elif frame.shape != self.shape:
+            raise ValueError(f"錄影中畫面尺寸改變: {self.shape} -> {frame.shape}")
+
+        self._frames.write(np.ascontiguousarray(frame, dtype=np.uint8).data)
+        self._ts.write(np.float64(ts).tobytes())
+        self.count += 1
         return frame
 
+    def capture_regions(self, rects, out):
+        """Partial grabs are passed through and not recorded, only whole frames are"""
+        self.source.capture_regions(rects, out)
+
+    def _write_header(self):
+        header = {
+            "shape": list(self.shape),
+            "dtype": "uint8",
+            "offset": list(self.source.monitor_offset()),
+        }
+        with open(self.path + ".json", "w") as f:
+            json.dump(header, f)
+
+    def monitor_offset(self):
+        return self.source.monitor_offset()
+
+    def close(self):
+        self._frames.close()
+        self._ts.close()
+        self.source.close()
+
+class ReplaySource(CaptureSource):
+    def __init__(self, path, realtime=False, loop=False):
+        """
+        Play back a recording made by FrameRecorder
+        path: str, Recording name (without extension)
+        realtime: bool, Wait between frames like the original recording, otherwise as fast as possible
+        loop: bool, Start over at the end instead of raising EOFError
+        """
+        with open(path + ".json") as f:
+            header = json.load(f)
+        shape = tuple(header["shape"])
+        self.offset = tuple(header.get("offset", (0, 0)))
+
+        # Memory-mapped, frames are read from the page cache without copying
+        frame_size = int(np.prod(shape))
+        n = os.path.getsize(path + ".frames") // frame_size
+        self.frames = np.memmap(path + ".frames", dtype=np.uint8, mode="r", shape=(n,) + shape)
+        self.timestamps = np.fromfile(path + ".ts", dtype=np.float64)[:n]
+
+        self.realtime = realtime
+        self.loop = loop
+        self.index = 0
+        self._start = None
+
+    def __len__(self):
+        return len(self.frames)
+
+    def capture(self):
+        if self.index >= len(self.frames):
+            if not self.loop or len(self.frames) == 0:
+                raise EOFError("錄影已播放完畢")
+            self.index = 0
+            self._start = None
+
+        i = self.index
+        if self.realtime:
+            if self._start is None:
+                self._start = time.perf_counter() - (self.timestamps[i] - self.timestamps[0])
+            delay = self._start + (self.timestamps[i] - self.timestamps[0]) - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+
+        self.index += 1
+        return self.frames[i]
+
+    def monitor_offset(self):
+        return self.offset
+
+    def close(self):
+        self.frames = None
+
 if __name__ == "__main__":
+    import mss
+
     # --- Test Block ---
     
     # List all monitor info
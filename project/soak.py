@@ -0,0 +1,281 @@
+# soak.py
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+import tracemalloc
+import numpy as np
+
+from screen_shot import CaptureSource, ReplaySource
+from template_matcher import TemplateMatcher
+from solver import Solver
+from scheduler import FrameScheduler
+from engine import Engine
+from synthetic_board import BoardRenderer, SyntheticSource
+from layout import GridLayout
+
+# Allocations of the test harness itself (frame synthesis), left out of the traced heap
+HARNESS_FILES = ("*synthetic_board.py", "*soak.py")
+
+# Allowed growth per hour after the warm-up, measured by the slope of a least-squares line
+BUDGETS = {
+    "rss_mb": 20.0,
+    "traced_mb": 5.0,
+    "fds": 2.0,
+    "unknowns_mb": 50.0,
+    "templates": 0.0,
+}
+
+class LoopSource(CaptureSource):
+    def __init__(self, make_source):
+        """Endless CaptureSource: a new source from make_source() whenever the current one ends"""
+        self.make_source = make_source
+        self.source = make_source()
+        self.frames = 0
+        self.frame = None  # Last captured frame
+
+    def capture(self):
+        try:
+            frame = self.source.capture()
+        except EOFError:
+            self.source.close()
+            self.source = self.make_source()
+            frame = self.source.capture()
+        self.frames += 1
+        self.frame = frame
+        return frame
+
+    def close(self):
+        self.source.close()
+
+class ResourceSampler:
+    def __init__(self, engine, source, unknown_dir):
+        """
+        Reads the process-wide resources soaked: RSS, Python heap (tracemalloc), open file handles,
+        size of the unknowns folder, template count. psutil is used when installed, /proc otherwise.
+        """
+        self.engine = engine
+        self.source = source
+        self.unknown_dir = unknown_dir
+        self.snapshot = None  # Heap snapshot of the latest sample
+        try:
+            import psutil
+            self._process = psutil.Process()
+        except ImportError:
+            self._process = None
+
+    def rss_mb(self):
+        if self._process is not None:
+            return self._process.memory_info().rss / 2**20
+        try:
+            with open("/proc/self/statm") as f:
+                return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+        except OSError:
+            return None
+
+    def fds(self):
+        if self._process is not None:
+            return self._process.num_handles() if os.name == "nt" else self._process.num_fds()
+        try:
+            return len(os.listdir("/proc/self/fd"))
+        except OSError:
+            return None
+
+    def unknowns(self):
+        paths = glob.glob(os.path.join(self.unknown_dir, "*.png"))
+        size = 0
+        for path in paths:
+            try:
+                size += os.path.getsize(path)
+            except OSError:
+                pass  # Removed by a training run meanwhile
+        return len(paths), size / 2**20
+
+    def heap_snapshot(self):
+        """tracemalloc snapshot without the harness, tracemalloc and import machinery"""
+        ignore = [tracemalloc.Filter(False, tracemalloc.__file__),
+                  tracemalloc.Filter(False, "<frozen importlib._bootstrap*>")]
+        ignore += [tracemalloc.Filter(False, pattern) for pattern in HARNESS_FILES]
+        return tracemalloc.take_snapshot().filter_traces(ignore)
+
+    def sample(self, elapsed):
+        files, size = self.unknowns()
+        self.snapshot = self.heap_snapshot() if tracemalloc.is_tracing() else None
+        traced = sum(s.size for s in self.snapshot.statistics("filename")) if self.snapshot is not None else None
+        matcher = self.engine.matcher
+        cache = self.engine.solver.cache if self.engine.solver is not None else None
+        return {
+            "t": elapsed,
+            "frames": self.source.frames,
+            "rss_mb": self.rss_mb(),
+            "traced_mb": traced / 2**20 if traced is not None else None,
+            "fds": self.fds(),
+            "unknowns_files": files,
+            "unknowns_mb": size,
+            "templates": sum(len(v) for v in matcher.templates.values()) if matcher is not None else None,
+            "solver_cache": len(cache) if cache is not None else None,
+        }
+
+def slope_per_hour(samples, key):
+    """Least-squares growth of samples[key] per hour, None without two valid points"""
+    points = [(s["t"], s[key]) for s in samples if s[key] is not None]
+    if len(points) < 2:
+        return None
+    t, v = np.array(points, dtype=np.float64).T
+    if t[-1] == t[0]:
+        return None
+    return float(np.polyfit(t / 3600.0, v, 1)[0])
+
+def top_allocators(before, after, limit=10):
+    """Source lines whose traced memory grew the most between two heap snapshots"""
+    stats = after.compare_to(before, "lineno")
+    return [{"where": f"{s.traceback[0].filename}:{s.traceback[0].lineno}",
+             "size_diff_kb": s.size_diff / 1024, "count_diff": s.count_diff}
+            for s in stats[:limit] if s.size_diff > 0]
+
+def soak(make_source, layout, templates_file, duration, interval, warmup, budgets, grid_every=0.0,
+         fast=False, trace=True, unknown_dir="unknowns"):
+    """
+    Run the worker loop (Engine.run on its thread) over an endless frame source for duration seconds,
+    sampling resources every interval seconds
+    warmup: float, Seconds excluded from the slopes (caches and pools filling up)
+    grid_every: float, Also recognize a whole frame with recognize_grid (which saves unknown cells)
+                every grid_every seconds, 0 to disable
+    return: report dict, report["passed"] is False if a metric grows faster than its budget over the
+            whole steady window and over its second half
+    """
+    if trace:
+        tracemalloc.start()
+    source = LoopSource(make_source)
+    scheduler = FrameScheduler(min_interval=0.0, max_interval=0.0) if fast else None
+    engine = Engine(capture=source, layout=layout, realtime=False, templates_file=templates_file,
+                    calibration_file=None, scheduler=scheduler)
+    engine.open()
+    engine.matcher.unknown_dir = unknown_dir
+    sampler = ResourceSampler(engine, source, unknown_dir)
+
+    samples = []
+    baseline = None
+    start = time.perf_counter()
+    next_grid = start + grid_every if grid_every > 0 else None
+    engine.start()
+    try:
+        while True:
+            elapsed = time.perf_counter() - start
+            samples.append(sampler.sample(elapsed))
+            if baseline is None and elapsed >= warmup:
+                baseline = sampler.snapshot
+            s = samples[-1]
+            print(f"[{elapsed:7.0f} s] 影格 {s['frames']:7d}  RSS {s['rss_mb'] or 0:7.1f} MB  "
+                  f"heap {s['traced_mb'] or 0:6.1f} MB  fds {s['fds'] or 0:4d}  "
+                  f"unknowns {s['unknowns_files']} ({s['unknowns_mb']:.1f} MB)")
+            if elapsed >= duration or not engine.running:
+                break
+            deadline = start + min(elapsed + interval, duration)
+            while time.perf_counter() < deadline:
+                if next_grid is not None and time.perf_counter() >= next_grid and source.frame is not None:
+                    engine.matcher.recognize_grid(np.array(source.frame), layout=layout)
+                    next_grid += grid_every
+                time.sleep(min(0.2, max(0.0, deadline - time.perf_counter())))
+    finally:
+        engine.stop()
+        final = sampler.snapshot
+        if trace:
+            tracemalloc.stop()
+
+    steady = [s for s in samples if s["t"] >= warmup] or samples
+    growth = {}
+    passed = True
+    for key in ("rss_mb", "traced_mb", "fds", "unknowns_mb", "unknowns_files", "templates", "solver_cache"):
+        slope = slope_per_hour(steady, key)
+        # A leak keeps growing to the end, while a one-off step (allocator arenas, caches filling)
+        # only raises the slope of the half it falls in
+        late = slope_per_hour(steady[len(steady) // 2:], key)
+        values = [s[key] for s in steady if s[key] is not None]
+        budget = budgets.get(key)
+        ok = (slope is None or budget is None or slope <= budget + 1e-6  # polyfit rounding on flat series
+              or (late is not None and late <= budget + 1e-6))
+        passed &= ok
+        growth[key] = {"first": values[0] if values else None, "last": values[-1] if values else None,
+                       "per_hour": slope, "late_per_hour": late, "budget": budget, "ok": ok}
+    return {
+        "duration": samples[-1]["t"],
+        "frames": source.frames,
+        "warmup": warmup,
+        "growth": growth,
+        "top_allocators": top_allocators(baseline, final) if baseline is not None and final is not None else [],
+        "samples": samples,
+        "passed": passed,
+    }
+
+def print_report(report):
+    fps = report["frames"] / report["duration"] if report["duration"] > 0 else 0.0
+    print(f"\n=== 長時間測試 {report['duration']:.0f} 秒，{report['frames']} 影格 ({fps:.1f} FPS)，"
+          f"前 {report['warmup']:.0f} 秒不計 ===")
+    for key, g in report["growth"].items():
+        if g["per_hour"] is None:
+            continue
+        budget = f"上限 {g['budget']:g}/h" if g["budget"] is not None else ""
+        late = f"(後半 {g['late_per_hour']:+9.2f})" if g["late_per_hour"] is not None else ""
+        print(f"  {key:15s} {g['first']:10.2f} -> {g['last']:10.2f}  每小時 {g['per_hour']:+9.2f} {late:17s} "
+              f"{budget:14s} {'' if g['ok'] else '超出預算'}")
+    if report["top_allocators"]:
+        print("記憶體成長最多的位置:")
+        for a in report["top_allocators"]:
+            print(f"  {a['size_diff_kb']:+9.1f} KB {a['count_diff']:+7d} 個  {a['where']}")
+    print("結果: " + ("通過" if report["passed"] else "失敗"))
+
+def main():
+    parser = argparse.ArgumentParser(description="長時間測試: 以錄影或合成影格驅動擷取迴圈，檢查記憶體與資源是否持續成長")
+    parser.add_argument("--replay", help="FrameRecorder 錄影檔名稱 (不含副檔名)，循環播放")
+    parser.add_argument("--synthetic", action="store_true", help="用模板合成盤面並模擬消除")
+    parser.add_argument("--noise", type=float, default=0.0, help="合成盤面的雜訊強度")
+    parser.add_argument("--rows", type=int, default=14)
+    parser.add_argument("--cols", type=int, default=8)
+    parser.add_argument("--templates", default="digits.pkl")
+    parser.add_argument("--duration", type=float, default=600.0, help="測試秒數")
+    parser.add_argument("--interval", type=float, default=10.0, help="取樣間隔秒數")
+    parser.add_argument("--warmup", type=float, default=60.0, help="不列入成長斜率的開頭秒數")
+    parser.add_argument("--grid-every", type=float, default=0.0,
+                        help="每隔幾秒以 recognize_grid 辨識整張盤面 (會儲存未知圖片)，0 為關閉")
+    parser.add_argument("--unknown-dir", default="unknowns")
+    parser.add_argument("--fast", action="store_true", help="擷取之間不等待")
+    parser.add_argument("--no-tracemalloc", action="store_true", help="不追蹤 Python 記憶體配置 (較快)")
+    parser.add_argument("--budget", action="append", default=[],
+                        help="每小時成長上限，例如 rss_mb=10 (可重複；設為 none 取消)")
+    parser.add_argument("--json", help="將結果寫入 JSON 檔")
+    args = parser.parse_args()
+
+    budgets = dict(BUDGETS)
+    for item in args.budget:
+        key, value = item.split("=", 1)
+        budgets[key.strip()] = None if value.strip().lower() == "none" else float(value)
+
+    if args.replay:
+        probe = ReplaySource(args.replay)
+        h, w = probe.frames.shape[1:3]
+        probe.close()
+        make_source = lambda: ReplaySource(args.replay, realtime=not args.fast)
+    elif args.synthetic:
+        w, h = 480, 830
+        glyphs = TemplateMatcher(templates_file=args.templates, dont_save_unknowns=True, verbose=False).templates
+        renderer = BoardRenderer(glyphs, rows=args.rows, cols=args.cols)
+        renderer.prerender()
+        make_source = lambda: SyntheticSource(renderer, Solver(10), frames=100000, refill=True, noise=args.noise)
+    else:
+        parser.error("需要 --replay 或 --synthetic")
+    layout = GridLayout(args.rows, args.cols, (0, 0, w, h))
+
+    report = soak(make_source, layout, args.templates, args.duration, args.interval, args.warmup, budgets,
+                  grid_every=args.grid_every, fast=args.fast, trace=not args.no_tracemalloc,
+                  unknown_dir=args.unknown_dir)
+    print_report(report)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    sys.exit(0 if report["passed"] else 1)
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,92 @@
 # solver.py
+import heapq
+import os
+import pickle
+from collections import OrderedDict
 from itertools import combinations
+import numpy as np
+
+import kernels
+
+class MoveCache:
+    def __init__(self, capacity=4096):
+        """
+        Bounded LRU of solver results, keyed by the bytes of the int8 board (see Solver._cache_key)
+        capacity: int, Number of boards kept, the least recently used one is evicted first
+        """
+        self.capacity = capacity
+        self._data = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key):
+        moves = self._data.get(key)
+        if moves is None:
+            self.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.hits += 1
+        return moves
+
+    def put(self, key, moves):
+        self._data[key] = moves
+        self._data.move_to_end(key)
+        if len(self._data) > self.capacity:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    @property
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def stats(self):
+        return {"size": len(self._data), "capacity": self.capacity, "hits": self.hits,
+                "misses": self.misses, "evictions": self.evictions, "hit_rate": self.hit_rate}
+
+    def save(self, path):
+        """Write all entries (oldest first) so a later run starts warm, e.g. for benchmarks"""
+        with open(path, "wb") as f:
+            pickle.dump(list(self._data.items()), f)
+
+    def load(self, path):
+        """
+        Add the entries of a file written by save(), keeping the most recent ones within capacity
+        return: number of entries loaded, 0 if the file does not exist
+        """
+        if not path or not os.path.exists(path):
+            return 0
+        with open(path, "rb") as f:
+            items = pickle.load(f)
+        for key, moves in items[-self.capacity:]:
+            self.put(key, moves)
+        return min(len(items), self.capacity)
 
 class Solver:
-    def __init__(self, target_sum=10):
+    def __init__(self, target_sum=10, engine=None, warm_up=True, cache_size=0):
+        """
+        engine: str, "python" (reference loops), "numpy" or "numba" (see kernels.py),
+                None for numba when installed, otherwise numpy
+        warm_up: bool, Compile the numba kernels now (False: the caller runs kernels.warm_up())
+        cache_size: int, Boards whose moves are remembered (MoveCache), 0 to always compute
+        """
         self.target = target_sum
+        self.cache = MoveCache(cache_size) if cache_size > 0 else None
+        if engine is None:
+            engine = "numba" if kernels.HAVE_NUMBA else "numpy"
+        if engine == "numba" and not kernels.HAVE_NUMBA:
+            raise ValueError("找不到 Numba，無法使用 numba 引擎")
+        if engine not in ("python", "numpy", "numba"):
+            raise ValueError(f"未知的 Solver 引擎: {engine}")
+        self.engine = engine
+        # The numba engine runs the NumPy scan until kernels.warm_up() has finished
+        self._pair_scan = kernels.pair_scan if engine == "numba" else kernels.pair_scan_numpy
+        if engine == "numba" and warm_up:
+            kernels.warm_up()
 
     def _build_prefix_sum_and_nodes(self, matrix):
         rows = len(matrix)
@@ -19,19 +102,81 @@ class Solver:
                     nodes.append((r, c))
         return rows, cols, p_sum, nodes
 
-    def solve(self, matrix):
+    def _build_blocked_sum(self, rows, cols, blocked):
+        b_sum = [[0] * (cols + 1) for _ in range(rows + 1)]
+        for r in range(rows):
+            for c in range(cols):
+                val = 1 if blocked[r][c] else 0
+                b_sum[r+1][c+1] = b_sum[r][c+1] + b_sum[r+1][c] - b_sum[r][c] + val
+        return b_sum
+
+    def solve(self, matrix, blocked=None):
         """
         [Backward Compatibility] Return only "one" best solution (smallest area first)
         """
-        moves = self.find_all_moves(matrix, sort_by_area=True)
+        moves = self.find_all_moves(matrix, sort_by_area=True, blocked=blocked)
         return moves[0] if moves else None
 
-    def find_all_moves(self, matrix, sort_by_area=True):
+    def find_all_moves(self, matrix, sort_by_area=True, blocked=None):
         """
         [New Feature] Return "all" possible solutions for the current board
+        blocked: 2D bool mask (same shape as matrix), Cells whose value is not trusted
+                 (e.g. still animating), rectangles covering any of them are skipped
         Return format: list of (r1, c1, r2, c2)
         """
+        if self.cache is None:
+            return self._find_all_moves(matrix, sort_by_area, blocked)
+        # A repeated board costs one key and one lookup
+        key = self._cache_key(matrix, blocked, sort_by_area)
+        moves = self.cache.get(key)
+        if moves is None:
+            moves = tuple(self._find_all_moves(matrix, sort_by_area, blocked))
+            self.cache.put(key, moves)
+        return list(moves)
+
+    def _cache_key(self, matrix, blocked, sort_by_area):
+        board = np.asarray(matrix, dtype=np.int8)
+        mask = np.packbits(np.asarray(blocked, dtype=bool)).tobytes() if blocked is not None else b""
+        return (self.target, sort_by_area, board.shape, board.tobytes(), mask)
+
+    def _find_all_moves(self, matrix, sort_by_area=True, blocked=None):
+        valid_moves, candidates = self._scan(matrix, blocked)
+
+        # 3. Sort
+        if sort_by_area:
+            # Sort by smallest area first (usually less likely to block other solutions)
+            candidates.sort(key=lambda x: x[0])
+        
+        # Extract move part
+        valid_moves.extend([c[1] for c in candidates])
+        
+        return valid_moves
+
+    def top_moves(self, matrix, k, blocked=None):
+        """
+        The k best moves in the order of find_all_moves (rank 0 is what solve() returns)
+        Only the k smallest rectangles are kept, the full candidate list is never sorted
+        (with a cache the full list is computed once per board and sliced)
+        """
+        if self.cache is not None:
+            return self.find_all_moves(matrix, blocked=blocked)[:k]
+        valid_moves, candidates = self._scan(matrix, blocked)
+        if len(valid_moves) < k:
+            best = heapq.nsmallest(k - len(valid_moves), candidates, key=lambda x: x[0])
+            valid_moves.extend([c[1] for c in best])
+        return valid_moves[:k]
+
+    def _scan(self, matrix, blocked=None):
+        """
+        return: (1x1 moves, list of (area, move) for the rectangles, in scan order)
+        """
+        if self.engine != "python":
+            return self._scan_kernel(matrix, blocked)
+
         rows, cols, p_sum, nodes = self._build_prefix_sum_and_nodes(matrix)
+        b_sum = self._build_blocked_sum(rows, cols, blocked) if blocked is not None else None
+        if b_sum is not None:
+            nodes = [(r, c) for r, c in nodes if not blocked[r][c]]
         valid_moves = []
 
         # 1. Check single point (1x1)
@@ -55,19 +200,28 @@ class Solver:
                         p_sum[min_r][min_c])
             
             if rect_sum == self.target:
+                if b_sum is not None and (b_sum[max_r+1][max_c+1] - b_sum[min_r][max_c+1] -
+                                          b_sum[max_r+1][min_c] + b_sum[min_r][min_c]):
+                    continue
                 area = (max_r - min_r + 1) * (max_c - min_c + 1)
                 # Store in tuple: (area, move_tuple)
                 candidates.append((area, (r1, c1, r2, c2)))
 
-        # 3. Sort
-        if sort_by_area:
-            # Sort by smallest area first (usually less likely to block other solutions)
-            candidates.sort(key=lambda x: x[0])
-        
-        # Extract move part
-        valid_moves.extend([c[1] for c in candidates])
-        
-        return valid_moves
+        return valid_moves, candidates
+
+    def _scan_kernel(self, matrix, blocked=None):
+        """Same as _scan() with the compiled / vectorized pair scan"""
+        grid = np.asarray(matrix, dtype=np.int32)
+        if blocked is not None:
+            blocked = np.asarray(blocked, dtype=bool)
+        single = grid == self.target
+        if blocked is not None:
+            single &= ~blocked
+        valid_moves = [(r, c, r, c) for r, c in np.argwhere(single).tolist()]
+
+        found = self._pair_scan(grid, blocked, self.target).tolist()
+        candidates = [(area, (r1, c1, r2, c2)) for area, r1, c1, r2, c2 in found]
+        return valid_moves, candidates
 
 if __name__ == "__main__":
     solver = Solver(10)
@@ -79,4 +233,11 @@ if __name__ == "__main__":
     all_moves = solver.find_all_moves(test_grid)
     print(f"找到 {len(all_moves)} 組解:")
     for m in all_moves:
-        print(m)
\ No newline at end of file
+        print(m)
+    print(f"前 2 組: {solver.top_moves(test_grid, 2)}")
+
+    # Repeated boards are answered from the cache
+    cached = Solver(10, cache_size=2)
+    for _ in range(3):
+        assert cached.find_all_moves(test_grid) == all_moves
+    print(f"快取: {cached.cache.stats()}")
\ No newline at end of file
@@ -3,19 +3,66 @@ import numpy as np
 import os
 import pickle
 import glob
-from screen_shot import ScreenCapture
+import threading
+import time
+import kernels
+from layout import load_layout
+
+MAX_UNKNOWNS = 2000  # Unknown cell images kept in unknown_dir, new ones are dropped beyond that
+PACKED_SUFFIX = ".packed.npz"  # Sidecar of the templates file holding the bit-packed bank
 
 class TemplateMatcher:
-    def __init__(self, templates_file='digits.pkl', unknown_dir='unknowns' , dont_save_unknowns=False):
+    def __init__(self, templates_file='digits.pkl', unknown_dir='unknowns' , dont_save_unknowns=False, verbose=True,
+                 feature_size=None, background=False, max_unknowns=MAX_UNKNOWNS, packed=False):
+        """
+        feature_size: tuple (h, w), Pre-scale the templates to this OCR crop size (see set_feature_size)
+        background: bool, Load, normalize and warm up the templates on a thread; matching waits for it
+        max_unknowns: int, Cap on the images in unknown_dir, so a long session cannot fill the disk
+        packed: bool, Match bit-packed features with XOR + popcount instead of float correlation
+                (see _build_packed_bank); the float templates are released once the bank is built
+        """
         self.templates_file = templates_file
-        self.unknown_dir = unknown_dir
+        self.unknown_dir = unknown_dir  # Created when the first unknown cell is saved
         self.dont_save_unknowns = dont_save_unknowns
+        self.max_unknowns = max_unknowns
+        self.packed = packed
+        self._unknown_count = None  # Images in unknown_dir, counted on the first save
+        self.verbose = verbose
         self.templates = {} 
-        
-        if not os.path.exists(self.unknown_dir):
-            os.makedirs(self.unknown_dir)
-            
-        self.load_templates()
+        self.feature_size = tuple(feature_size) if feature_size is not None else None
+        self._bank = None
+        self._released = False  # Packed mode: self.templates emptied, reloaded from the file when needed
+        self._layouts = {}  # (h, w) of a board image -> GridLayout used for it
+        self.load_time = None  # Seconds spent loading and preparing the templates
+
+        self._ready = threading.Event()
+        if background:
+            threading.Thread(target=self._prepare, name="TemplateLoader", daemon=True).start()
+        else:
+            self.load_templates()
+            if packed:
+                self._build_bank()  # Built (or read from the sidecar) here, not on the first match
+            self._ready.set()
+
+    def _prepare(self):
+        """Background start-up: unpickle, build the normalized bank and run one match"""
+        start = time.perf_counter()
+        try:
+            self.load_templates()
+            self._build_bank()
+            self.warm_up()
+        finally:
+            self.load_time = time.perf_counter() - start
+            self._ready.set()
+
+    def wait_ready(self, timeout=None):
+        """Block until a background load has finished, return False on timeout"""
+        return self._ready.wait(timeout)
+
+    def warm_up(self):
+        """Match one blank feature per template size, so the first real frame runs on a warm code path"""
+        bank = self._bank if self._bank is not None else self._build_bank()
+        self._match_bank([np.zeros(entry[0], dtype=np.uint8) for entry in bank or []])
 
     def load_templates(self):
         if os.path.exists(self.templates_file):
@@ -35,13 +82,23 @@ class TemplateMatcher:
                         count += 1
                 
                 self.templates = new_data
-                print(f"系統: 已載入模板庫，共包含 {count} 個樣本。")
+                self._bank = None
+                self._released = False
+                if self.verbose:
+                    print(f"系統: 已載入模板庫，共包含 {count} 個樣本。")
             except Exception as e:
                 print(f"載入失敗: {e}，將建立新資料庫。")
                 self.templates = {}
-        else:
+        elif self.verbose:
             print("系統: 尚未有模板檔案，請先進行訓練。")
 
+    def _ensure_templates(self):
+        """Reload the float templates released by packed mode"""
+        if self._released:
+            verbose, self.verbose = self.verbose, False
+            self.load_templates()
+            self.verbose = verbose
+
     def save_templates(self):
         with open(self.templates_file, 'wb') as f:
             pickle.dump(self.templates, f)
@@ -61,32 +118,223 @@ class TemplateMatcher:
         ch, cw = gray.shape
         # center crop to avoid borders
         crop_gray = gray[int(ch*0.2):int(ch*0.8), int(cw*0.25):int(cw*0.75)]
+        return self.binarize(crop_gray)
+
+    @staticmethod
+    def binarize(crop_gray):
+        """Feature map of an already cropped grayscale OCR window (see GridLayout.crop_slices)"""
         _, thresh = cv2.threshold(crop_gray, 170, 255, cv2.THRESH_BINARY)
         return thresh
 
-    def _match_feature(self, feature_img):
-        """
-        Internal method: Compare feature map with all templates, return (digit, score)
-        """
-        best_match_num = 0
-        global_best_score = 0.0
-        
+    @staticmethod
+    def is_blank(crop_gray, max_fraction=0.02):
+        """Blank-cell check: almost no digit pixels in an OCR window, far cheaper than matching"""
+        thresh = TemplateMatcher.binarize(crop_gray)
+        return cv2.countNonZero(thresh) <= max_fraction * thresh.size
+
+    def _template_groups(self):
+        """{shape: (list of flattened templates, list of digits)}, templates scaled to feature_size"""
+        self._ensure_templates()
+        groups = {}
         for num, template_list in self.templates.items():
             for tmpl in template_list:
+                if self.feature_size is not None and tmpl.shape != self.feature_size:
+                    tmpl = cv2.resize(tmpl, (self.feature_size[1], self.feature_size[0]), interpolation=cv2.INTER_AREA)
+                vecs, labels = groups.setdefault(tmpl.shape, ([], []))
+                vecs.append(tmpl.ravel())
+                labels.append(num)
+        return groups
+
+    def _build_bank(self):
+        """
+        Stack all templates of the same size into one zero-mean, unit-length matrix.
+        A dot product with a normalized feature then gives the same score as TM_CCOEFF_NORMED,
+        so one matrix product compares many features with every template at once.
+        """
+        if self.packed:
+            return self._build_packed_bank()
+        bank = []
+        for shape, (vecs, labels) in self._template_groups().items():
+            matrix = self._normalize(np.asarray(vecs, dtype=np.float32))
+            bank.append((shape, matrix, np.asarray(labels)))
+        self._bank = bank
+        return bank
+
+    def _build_packed_bank(self):
+        """
+        Packed mode uses the float bank's shapes (the stored template size, or feature_size): features
+        are resized to them the same way, then both sides are thresholded to bits (1 bit per pixel,
+        64-bit words, stored word-major) and scored by the phi coefficient, which only needs the
+        Hamming distance and the two bit counts. Scores are close to the float ones but not equal,
+        since float mode correlates the interpolated gray values (see test_template_matcher.py).
+        The bank is kept in the sidecar of the templates file, and the float templates are released.
+        """
+        key = self._packed_key()
+        bank = self._load_packed_bank(key)
+        if bank is None:
+            bank = []
+            for shape, (vecs, labels) in self._template_groups().items():
+                # Templates scaled to feature_size are grayscale again, threshold them like the features
+                bits = np.asarray(vecs, dtype=np.uint8) > 127
+                words = np.ascontiguousarray(self._pack(bits).T)  # Word-major, see kernels.hamming_numpy
+                bank.append((shape, words, np.asarray(labels, dtype=np.int64), np.count_nonzero(bits, axis=1)))
+            self._save_packed_bank(key, bank)
+        self._bank = bank
+        if self.templates:
+            self.templates = {}
+            self._released = True
+        return bank
+
+    @staticmethod
+    def _pack(bits):
+        """(n, pixels) bool -> (n, words) uint64"""
+        packed = np.packbits(bits, axis=1)
+        pad = -packed.shape[1] % 8
+        if pad:
+            packed = np.pad(packed, ((0, 0), (0, pad)))
+        return np.ascontiguousarray(packed).view(np.uint64)
+
+    def _packed_path(self):
+        return os.path.splitext(self.templates_file)[0] + PACKED_SUFFIX
+
+    def _packed_key(self):
+        """Identifies the templates file and feature_size a packed bank was built from"""
+        if not os.path.exists(self.templates_file):
+            return None
+        stat = os.stat(self.templates_file)
+        return f"{stat.st_size}:{stat.st_mtime_ns}:{self.feature_size}"
+
+    def _load_packed_bank(self, key):
+        path = self._packed_path()
+        if key is None or not os.path.exists(path):
+            return None
+        try:
+            with np.load(path) as data:
+                if str(data["key"]) != key:
+                    return None
+                entries = [(tuple(int(v) for v in data[f"shape{i}"]), data[f"bits{i}"], data[f"labels{i}"],
+                            data[f"ones{i}"]) for i in range(int(data["groups"]))]
+            return entries
+        except (OSError, KeyError, ValueError) as e:
+            print(f"讀取 {path} 失敗: {e}，重新建立")
+            return None
+
+    def _save_packed_bank(self, key, bank):
+        if key is None:
+            return
+        arrays = {"key": np.array(key), "groups": np.array(len(bank))}
+        for i, (shape, bits, labels, ones) in enumerate(bank):
+            arrays.update({f"shape{i}": np.array(shape), f"bits{i}": bits, f"labels{i}": labels, f"ones{i}": ones})
+        try:
+            np.savez(self._packed_path(), **arrays)
+        except OSError as e:
+            print(f"無法儲存 {self._packed_path()}: {e}")
+
+    def set_feature_size(self, size):
+        """
+        Pre-scale all templates to the OCR crop size of a calibrated board, so cells are
+        compared without resizing them on every call
+        size: tuple (h, w), e.g. GridLayout.feature_size of the calibrated layout, None to use the stored sizes
+        """
+        self._ready.wait()
+        self.feature_size = tuple(size) if size is not None else None
+        self._bank = None
+        if self.packed:
+            self._build_bank()  # Not left to the first match
+
+    @staticmethod
+    def _normalize(vecs):
+        vecs -= vecs.mean(axis=1, keepdims=True)
+        norm = np.linalg.norm(vecs, axis=1, keepdims=True)
+        # Flat images (e.g. an empty cell) have no pattern, they score 0 against everything
+        vecs /= np.maximum(norm, 1e-6)
+        return vecs
+
+    def _match_features(self, features):
+        """
+        Internal method: Compare many feature maps with all templates in one pass
+        return: list of (digit, score), one per feature
+        """
+        if not self._ready.is_set():
+            self._ready.wait()
+        return self._match_bank(features)
+
+    def _match_bank(self, features):
+        """Same as _match_features, without waiting for a background load"""
+        if self.packed:
+            return self._match_packed(features)
+        n = len(features)
+        best_num = np.zeros(n, dtype=np.int64)
+        best_score = np.zeros(n, dtype=np.float32)
+        if n == 0:
+            return []
+        bank = self._bank if self._bank is not None else self._build_bank()
+
+        for shape, matrix, labels in bank:
+            h, w = shape
+            vecs = np.empty((n, h * w), dtype=np.float32)
+            for i, feature in enumerate(features):
                 # Size correction
-                if feature_img.shape != tmpl.shape:
-                    resized_feature = cv2.resize(feature_img, (tmpl.shape[1], tmpl.shape[0]))
-                else:
-                    resized_feature = feature_img
+                if feature.shape != shape:
+                    feature = cv2.resize(feature, (w, h))
+                vecs[i] = feature.ravel()
+            scores = self._normalize(vecs) @ matrix.T
 
-                res = cv2.matchTemplate(resized_feature, tmpl, cv2.TM_CCOEFF_NORMED)
-                score = res[0][0]
-                
-                if score > global_best_score:
-                    global_best_score = score
-                    best_match_num = num
-        
-        return best_match_num, global_best_score
+            idx = scores.argmax(axis=1)
+            top = scores[np.arange(n), idx]
+            better = top > best_score
+            best_score[better] = top[better]
+            best_num[better] = labels[idx[better]]
+
+        return [(int(num), float(score)) for num, score in zip(best_num, best_score)]
+
+    def _match_packed(self, features):
+        """Packed version of _match_bank, features are resized to every bank shape the same way"""
+        n = len(features)
+        best_num = np.zeros(n, dtype=np.int64)
+        best_score = np.zeros(n, dtype=np.float32)
+        if n == 0:
+            return []
+        bank = self._bank if self._bank is not None else self._build_bank()
+
+        for shape, words, labels, ones in bank:
+            h, w = shape
+            bits = np.empty((n, h * w), dtype=bool)
+            for i, feature in enumerate(features):
+                if feature.shape != shape:
+                    feature = cv2.resize(feature, (w, h))
+                np.greater(feature.ravel(), 127, out=bits[i])
+            scores = self._packed_scores(bits, words, ones)
+
+            idx = scores.argmax(axis=1)
+            top = scores[np.arange(n), idx]
+            better = top > best_score
+            best_score[better] = top[better]
+            best_num[better] = labels[idx[better]]
+
+        return [(int(num), float(score)) for num, score in zip(best_num, best_score)]
+
+    def _packed_scores(self, bits, bank_bits, bank_ones):
+        """
+        Phi coefficient of every feature against every packed template
+        bits: (n, pixels) bool features; bank_bits: (words, m) uint64; bank_ones: (m,) set bits per template
+        return: (n, m) float32, equal to the normalized correlation of the 0/255 images
+        """
+        size = bits.shape[1]
+        ones = np.count_nonzero(bits, axis=1).astype(np.float64)[:, None]
+        bank_ones = bank_ones.astype(np.float64)[None, :]
+        # Pixels set in both: (ones + bank_ones - differing bits) / 2
+        both = (ones + bank_ones - kernels.hamming_numpy(self._pack(bits), bank_bits)) / 2
+        num = size * both - ones * bank_ones
+        den = np.sqrt(ones * (size - ones) * bank_ones * (size - bank_ones))
+        # Flat images (e.g. an empty cell) have no pattern, they score 0 against everything
+        return np.divide(num, den, out=np.zeros_like(num), where=den > 0).astype(np.float32)
+
+    def _match_feature(self, feature_img):
+        """
+        Internal method: Compare feature map with all templates, return (digit, score)
+        """
+        return self._match_features([feature_img])[0]
 
     def recognize_cell(self, cell_img):
         """
@@ -94,6 +342,14 @@ class TemplateMatcher:
         img: Single cell BGR image (OpenCV format)
         return: Recognized digit (int), return 0 if low confidence
         """
+        num, _ = self.recognize_cell_with_score(cell_img)
+        return num
+
+    def recognize_cell_with_score(self, cell_img):
+        """
+        Same as recognize_cell, but also return the match score
+        return: (digit, score), digit is 0 if low confidence
+        """
         # 1. Preprocessing
         feature = self.preprocess_cell_img(cell_img)
         
@@ -102,52 +358,108 @@ class TemplateMatcher:
         
         # 3. Threshold check
         if score > 0.85:
-            return num
+            return num, score
         else:
-            return 0
+            return 0, score
+
+    def recognize_cells_with_score(self, cell_imgs):
+        """
+        Batch version of recognize_cell_with_score, all cells are matched in one pass
+        return: list of (digit, score)
+        """
+        features = [self.preprocess_cell_img(cell) for cell in cell_imgs]
+        return [(num if score > 0.85 else 0, score) for num, score in self._match_features(features)]
+
+    def recognize_crops_with_score(self, crops):
+        """
+        Like recognize_cells_with_score, for grayscale OCR windows cut with GridLayout.crop_slices
+        return: list of (digit, score)
+        """
+        features = [self.binarize(crop) for crop in crops]
+        return [(num if score > 0.85 else 0, score) for num, score in self._match_features(features)]
 
-    def recognize_grid(self, img):
+    def layout_for(self, img, layout=None):
+        """
+        GridLayout for a board image: the given one if it fits the image size, otherwise
+        the same grid spread evenly over the image (cached per geometry and size; layouts of the
+        same name, e.g. calibrated and not, can differ)
+        """
+        h, w = img.shape[:2]
+        if layout is not None and (layout.width, layout.height) == (w, h):
+            return layout
+        geometry = None
+        if layout is not None:
+            geometry = (layout.rows, layout.cols, layout.region, layout.gap, layout.crop, layout.origin,
+                        layout.pitch)
+        key = (geometry, h, w)
+        if key not in self._layouts:
+            base = layout or load_layout()
+            self._layouts[key] = base.resized(w, h)
+        return self._layouts[key]
+
+    def recognize_grid(self, img, layout=None):
         """Recognize the entire large image (Grid)"""
-        rows, cols = 14, 8
-        grid = []
-        
-        h, w, _ = img.shape
-        dy = h // rows
-        dx = w // cols
+        return self.recognize_grids([img], layout=layout)[0]
+
+    def recognize_grids(self, imgs, layout=None):
+        """
+        Recognize several board images, all their cells are matched in one pass
+        layout: GridLayout, Cell positions (default: the default layout of layouts.yaml)
+        """
+        features = []
+        layouts = []
+        for img in imgs:
+            lay = self.layout_for(img, layout)
+            layouts.append(lay)
+            gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY) if img.ndim == 3 else img
+            # 1. Preprocessing (the crop windows come from the layout tables)
+            for row in lay.crop_slices:
+                for window in row:
+                    features.append(self.binarize(gray[window]))
 
         # print("Start multi-template recognition...") # Commented out for performance
-        
-        for r in range(rows):
-            row_data = []
-            for c in range(cols):
-                # Slice
-                y1, y2 = r * dy, (r + 1) * dy
-                x1, x2 = c * dx, (c + 1) * dx
-                cell = img[y1:y2, x1:x2]
-                
-                # 1. Preprocessing
-                cell_feature = self.preprocess_cell_img(cell)
-                
-                # 2. Matching
-                best_match_num, global_best_score = self._match_feature(cell_feature)
-                
-                # 3. Check and save
-                if global_best_score > 0.9:
-                    row_data.append(best_match_num)
-                else:
-                    # Save unknown images
-                    if not self.dont_save_unknowns:
-                        import time
-                        timestamp = int(time.time() * 1000)
-                        filename = os.path.join(self.unknown_dir, f"unknown_r{r}c{c}_{timestamp}.png")
-                        cv2.imwrite(filename, cell_feature)
-                    row_data.append(0)
-
-            grid.append(row_data)
-        return grid
-    
+        # 2. Matching
+        matches = self._match_features(features)
+
+        grids = []
+        i = 0
+        for lay in layouts:
+            grid = []
+            for r in range(lay.rows):
+                row_data = []
+                for c in range(lay.cols):
+                    best_match_num, global_best_score = matches[i]
+                    # 3. Check and save
+                    if global_best_score > 0.9:
+                        row_data.append(best_match_num)
+                    else:
+                        # Save unknown images
+                        if not self.dont_save_unknowns:
+                            self._save_unknown(features[i], r, c)
+                        row_data.append(0)
+                    i += 1
+                grid.append(row_data)
+            grids.append(grid)
+        return grids
+
+    def _save_unknown(self, feature, r, c):
+        """Write an unrecognized cell to unknown_dir for training, unless it already holds max_unknowns"""
+        if self._unknown_count is None:
+            os.makedirs(self.unknown_dir, exist_ok=True)
+            self._unknown_count = len(glob.glob(os.path.join(self.unknown_dir, "*.png")))
+        if self._unknown_count >= self.max_unknowns:
+            return
+        timestamp = int(time.time() * 1000)
+        filename = os.path.join(self.unknown_dir, f"unknown_r{r}c{c}_{timestamp}.png")
+        if cv2.imwrite(filename, feature):
+            self._unknown_count += 1
+            if self._unknown_count == self.max_unknowns:
+                print(f"{self.unknown_dir} 已達 {self.max_unknowns} 張上限，暫停儲存未知圖片 (訓練後會重新計算)")
+
     # ... (train_from_folder 保持不變) ...
     def train_from_folder(self):
+        self._ready.wait()
+        self._ensure_templates()
         print(f"正在掃描 {self.unknown_dir} 資料夾進行增量學習...")
         image_paths = glob.glob(os.path.join(self.unknown_dir, "*.png"))
         count = 0
@@ -180,18 +492,27 @@ class TemplateMatcher:
                     os.remove(path)
             elif "unknown" in filename:
                 pass
+        self._unknown_count = None  # Trained and renamed files were removed
         if count > 0:
+            self._bank = None
             self.save_templates()
             print(f"成功新增 {count} 個變體模板！")
         else:
             print("沒有發現新的已命名圖片。")
 
 if __name__ == "__main__":
-    # --- Configuration Area ---
-    GAME_REGION = (720, 220, 480, 830) # Example values (x, y, w, h)
-    MONITOR_ID = 2
-    
+    from engine import MONITOR_ID
+    from calibration import CalibrationProfile
+
+    # The calibrated geometry wins over the configured layout
+    profile = CalibrationProfile.load()
+    layout = load_layout(profile=profile)
+    if profile is not None:
+        MONITOR_ID = profile.monitor_id
+
     matcher = TemplateMatcher()
+    if profile is not None:
+        matcher.set_feature_size(layout.feature_size)
     
     print("\n[多重模板系統]")
     print("1. 辨識模式")
@@ -200,12 +521,12 @@ if __name__ == "__main__":
     choice = input("輸入: ").strip()
     
     if choice == '1':
-        sc = ScreenCapture(monitor_idx=MONITOR_ID, region=GAME_REGION)
+        from screen_shot import ScreenCapture
+        sc = ScreenCapture(monitor_idx=MONITOR_ID, region=layout.region)
         print("1秒後截圖...")
-        import time
         time.sleep(1)
         img = sc.capture()
-        result = matcher.recognize_grid(img)
+        result = matcher.recognize_grid(img, layout=layout)
         
         print("\n結果:")
         for row in result:
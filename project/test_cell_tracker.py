@@ -0,0 +1,65 @@
+# test_cell_tracker.py
+import numpy as np
+
+from cell_tracker import CellTracker, STABLE, SETTLED, UNSETTLED
+from layout import GridLayout
+
+CELL = 40
+
+def digit(size, value=255):
+    """Square "glyph" of the given size centered in one cell"""
+    img = np.zeros((CELL, CELL), dtype=np.uint8)
+    a = (CELL - size) // 2
+    img[a:a + size, a:a + size] = value
+    return img
+
+def run(tracker, frames, labels, start=0):
+    """Feed single-cell frames, commit every SETTLED cell with its label, return the states"""
+    states = []
+    for i, (frame, label) in enumerate(zip(frames, labels), start):
+        state = int(tracker.update(frame, i / 60)[0, 0])
+        if state == SETTLED:
+            tracker.commit(0, 0, label, 1.0, i / 60)
+        tracker.end_frame()
+        states.append(state)
+    return states
+
+def make_tracker():
+    return CellTracker(GridLayout(1, 1, (0, 0, CELL, CELL)), diff_threshold=5, settle_frames=3, settle_ms=1e9)
+
+def test_refill_close_to_old_digit_is_read():
+    tracker = make_tracker()
+    nine = digit(16)
+    five = nine.copy()
+    five[CELL // 2 + 8, 12:28] = 255  # One more row: mean difference of 4 levels, under diff_threshold
+    run(tracker, [nine] * 3, [9] * 3)
+    assert tracker.digit[0, 0] == 9
+
+    fade = [(nine * f).astype(np.uint8) for f in (0.75, 0.5, 0.25)] + [digit(0)]
+    states = run(tracker, fade + [five] * 6, [0] * 4 + [5] * 6, start=3)
+    assert states[:4] == [UNSETTLED] * 4
+    # The new digit must be read before the cell counts as stable again
+    assert SETTLED in states[4:]
+    assert STABLE not in states[4:states.index(SETTLED, 4)]
+    assert tracker.digit[0, 0] == 5
+
+def test_flicker_returns_to_stable_without_reading():
+    tracker = make_tracker()
+    nine = digit(16)
+    run(tracker, [nine] * 3, [9] * 3)
+    states = run(tracker, [digit(0), nine, nine], [0, 9, 9], start=3)
+    assert states == [UNSETTLED, STABLE, STABLE]
+    assert tracker.digit[0, 0] == 9
+
+def test_trusted_cell_is_read_again_after_recheck_high_ms():
+    tracker = CellTracker(GridLayout(1, 1, (0, 0, CELL, CELL)), recheck_low_ms=100, recheck_high_ms=2000)
+    nine = digit(16)
+    run(tracker, [nine], [9])
+    assert tracker.recheck_at[0, 0] == 2.0
+    assert not tracker.is_due(0, 0, 1.9)
+    assert tracker.is_due(0, 0, 2.0)
+    # A re-check that confirms the digit schedules the next one
+    tracker.update(nine, 2.0)
+    tracker.commit(0, 0, 9, 0.99, 2.0, fresh=False)
+    tracker.end_frame()
+    assert tracker.next_recheck == 4.0
@@ -0,0 +1,55 @@
+# test_kernels.py
+import numpy as np
+import pytest
+
+import kernels
+from solver import Solver
+
+BOARDS = 100
+
+def random_boards(seed=0):
+    """(grid, blocked) pairs: partly empty 14x8 boards, every other one with blocked cells"""
+    rng = np.random.default_rng(seed)
+    for i in range(BOARDS):
+        grid = rng.integers(0, 10, size=(14, 8)) * (rng.random((14, 8)) < 0.7)
+        blocked = rng.random((14, 8)) < 0.1 if i % 2 else None
+        yield grid, blocked
+
+@pytest.fixture(params=["numpy", "numba"])
+def engine(request):
+    if request.param == "numba":
+        pytest.importorskip("numba")
+    return request.param
+
+def test_prefix_sum_matches_solver(engine):
+    fn = getattr(kernels, f"prefix_sum_{engine}")
+    for grid, _ in random_boards():
+        ref = Solver(10)._build_prefix_sum_and_nodes(grid.tolist())[2]
+        assert np.array_equal(fn(grid.astype(np.int32)), ref)
+
+def test_solver_engine_matches_python(engine):
+    python, solver = Solver(10, engine="python"), Solver(10, engine=engine)
+    for i, (grid, blocked) in enumerate(random_boards()):
+        matrix = grid.tolist()
+        ref = python.find_all_moves(matrix, blocked=blocked)
+        assert solver.find_all_moves(matrix, blocked=blocked) == ref, f"board {i}"
+        assert solver.find_all_moves(matrix, sort_by_area=False, blocked=blocked) == \
+            python.find_all_moves(matrix, sort_by_area=False, blocked=blocked), f"board {i}"
+        assert solver.top_moves(matrix, 5, blocked=blocked) == ref[:5], f"board {i}"
+
+def test_sum_absdiff(engine):
+    rng = np.random.default_rng(1)
+    # Non-contiguous cell views, like GridLayout.cell_views
+    a = rng.integers(0, 256, size=(28, 32), dtype=np.uint8).reshape(14, 2, 8, 4).transpose(0, 2, 1, 3)
+    b = rng.integers(0, 256, size=(14, 8, 2, 4), dtype=np.uint8)
+    ref = np.abs(a.astype(np.int64) - b.astype(np.int64)).sum(axis=(2, 3))
+    fn = getattr(kernels, f"sum_absdiff_{engine}")
+    assert np.array_equal(fn(a, b, np.empty((14, 8), dtype=np.uint64)), ref)
+
+def test_hamming():
+    rng = np.random.default_rng(2)
+    x = rng.integers(0, 2**63, size=(7, 3), dtype=np.uint64)
+    y = rng.integers(0, 2**63, size=(5, 3), dtype=np.uint64)
+    bits = lambda v: np.unpackbits(v.view(np.uint8), axis=1)
+    ref = (bits(x)[:, None, :] != bits(y)[None, :, :]).sum(axis=2)
+    assert np.array_equal(kernels.hamming_numpy(x, np.ascontiguousarray(y.T)), ref)
@@ -0,0 +1,64 @@
+# test_recognition_service.py
+import asyncio
+import json
+
+import cv2
+import numpy as np
+import pytest
+
+from layout import GridLayout
+from recognition_service import RecognitionService
+
+ROWS, COLS = 14, 8
+
+@pytest.fixture
+def board_path(tmp_path):
+    path = tmp_path / "board.png"
+    cv2.imwrite(str(path), np.zeros((ROWS * 20, COLS * 20, 3), dtype=np.uint8))
+    return str(path)
+
+def exchange(tmp_path, lines):
+    """Send raw request lines over one connection, return the decoded replies (one per line)"""
+    service = RecognitionService(templates_file=str(tmp_path / "none.pkl"),
+                                 layout=GridLayout(ROWS, COLS, (0, 0, COLS * 20, ROWS * 20)))
+    sock = str(tmp_path / "service.sock")
+
+    async def run():
+        server = asyncio.create_task(service.serve(path=sock))
+        for _ in range(100):
+            if service._server is not None:
+                break
+            await asyncio.sleep(0.01)
+        reader, writer = await asyncio.open_unix_connection(sock)
+        writer.write("".join(line + "\n" for line in lines).encode())
+        await writer.drain()
+        replies = [json.loads(await asyncio.wait_for(reader.readline(), 5.0)) for _ in lines]
+        writer.close()
+        server.cancel()
+        return replies
+
+    return asyncio.run(run())
+
+def test_non_object_request_gets_error(tmp_path):
+    reply, = exchange(tmp_path, ["[1, 2]"])
+    assert reply["id"] is None
+    assert "error" in reply
+
+@pytest.mark.parametrize("moves", ['"3"', "-1", "true", "1.5"])
+def test_bad_moves_gets_error(tmp_path, board_path, moves):
+    reply, = exchange(tmp_path, [f'{{"id": 7, "path": {json.dumps(board_path)}, "moves": {moves}}}'])
+    assert reply["id"] == 7
+    assert "error" in reply
+
+def test_bad_request_only_fails_itself(tmp_path, board_path):
+    lines = [json.dumps({"id": 1, "path": board_path}),
+             json.dumps({"id": 2, "path": str(tmp_path / "missing.png")}),
+             json.dumps({"id": 3, "image": "bm90IGFuIGltYWdl"}),
+             json.dumps({"id": 4, "path": board_path, "moves": 0})]
+    replies = {reply["id"]: reply for reply in exchange(tmp_path, lines)}
+    assert set(replies) == {1, 2, 3, 4}
+    assert "error" in replies[2] and "error" in replies[3]
+    for i in (1, 4):
+        assert "error" not in replies[i]
+        assert np.array(replies[i]["grid"]).shape == (ROWS, COLS)
+    assert replies[4]["moves"] == []
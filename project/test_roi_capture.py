@@ -0,0 +1,142 @@
+# test_roi_capture.py
+import os
+import time
+
+import numpy as np
+import pytest
+
+from engine import Engine
+from layout import GridLayout
+from screen_shot import CaptureSource, FrameRecorder, ReplaySource, RoiCapture
+from solver import Solver
+from synthetic_board import BoardRenderer, SyntheticSource
+from template_matcher import TemplateMatcher
+
+TEMPLATES = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir,
+                         "NIKKE_Tool_AZX-Service_Time", "digits.pkl")
+FPS = 60.0
+LAYOUT = GridLayout(14, 8, (0, 0, 480, 830))
+
+class ScreenReplay(CaptureSource):
+    """A recording shown like a screen: every grab of one tick sees the same frame"""
+    def __init__(self, path):
+        self.replay = ReplaySource(path)
+        self.frame = None
+
+    def __len__(self):
+        return len(self.replay)
+
+    def tick(self):
+        self.frame = self.replay.capture()
+
+    def capture(self):
+        return self.frame
+
+    def monitor_offset(self):
+        return self.replay.monitor_offset()
+
+    def close(self):
+        self.replay.close()
+
+@pytest.fixture(scope="module")
+def recording(tmp_path_factory):
+    """Short games, so the whole board is replaced several times"""
+    if not os.path.exists(TEMPLATES):
+        pytest.skip("digits.pkl not found")
+    glyphs = TemplateMatcher(templates_file=TEMPLATES, dont_save_unknowns=True, verbose=False).templates
+    path = str(tmp_path_factory.mktemp("roi") / "games")
+    recorder = FrameRecorder(SyntheticSource(BoardRenderer(glyphs), Solver(10), frames=120, moves=3), path)
+    for _ in range(120):
+        recorder.capture()
+    recorder.close()
+    return path
+
+def replay_grids(path, roi):
+    screen = ScreenReplay(path)
+    clock = [0.0]
+    capture = RoiCapture(screen, clock=lambda: clock[0], probes=LAYOUT.probe_rects()) if roi else screen
+    engine = Engine(capture=capture, layout=LAYOUT, realtime=False, templates_file=TEMPLATES,
+                    calibration_file=None)
+    engine.open()
+    engine.matcher.dont_save_unknowns = True
+    grids = []
+    for i in range(len(screen)):
+        clock[0] = i / FPS
+        screen.tick()
+        grids.append(np.array(engine.step(capture.capture(), now=clock[0]).grid))
+    engine.close()
+    return grids, capture
+
+def test_roi_capture_matches_full_capture(recording):
+    full, _ = replay_grids(recording, roi=False)
+    roi, capture = replay_grids(recording, roi=True)
+    assert capture.roi_grabs > 0
+    assert capture.probe_hits > 0
+    for i, (a, b) in enumerate(zip(full, roi)):
+        assert np.array_equal(a, b), f"frame {i}: {int((a != b).sum())} cells differ"
+
+class CountingScreen(CaptureSource):
+    """Fake screen that counts whole-frame and region grabs"""
+    def __init__(self, monitor_idx=1, region=None):
+        self.frame = np.zeros((region[3], region[2], 3), dtype=np.uint8)
+        self.full = 0
+        self.regions = 0
+
+    def capture(self):
+        self.full += 1
+        return self.frame
+
+    def capture_regions(self, rects, out):
+        self.regions += 1
+        for x, y, w, h in rects:
+            out[y:y + h, x:x + w] = self.frame[y:y + h, x:x + w]
+
+def test_recording_with_roi_capture(tmp_path, monkeypatch):
+    import engine as engine_module
+
+    monkeypatch.setattr(engine_module, "ROI_CAPTURE", True)
+    monkeypatch.setattr(engine_module, "ScreenCapture", CountingScreen)
+    path = str(tmp_path / "live")
+    engine = Engine(layout=LAYOUT, realtime=False, templates_file=str(tmp_path / "none.pkl"),
+                    calibration_file=None, record_file=path)
+    board = engine.boards[0]
+    board.open(None, None, engine.metrics)
+    screen = board.roi.source
+    for _ in range(11):
+        board.capture.capture()
+        board.roi.set_rois([LAYOUT.rect(0, 0, 0, 1)])
+    board.close()
+
+    assert isinstance(screen, CountingScreen)
+    assert screen.full == board.roi.full_grabs < 11
+    assert screen.regions > 0
+    replay = ReplaySource(path)
+    assert len(replay) == 11
+    replay.close()
+
+class TimedScreen(CountingScreen):
+    """Fake screen with a fixed cost per grab call"""
+    def __init__(self, full_cost, call_cost):
+        super().__init__(region=LAYOUT.region)
+        self.full_cost, self.call_cost = full_cost, call_cost
+
+    def capture(self):
+        time.sleep(self.full_cost)
+        return super().capture()
+
+    def capture_regions(self, rects, out):
+        time.sleep(self.call_cost * len(rects))
+        super().capture_regions(rects, out)
+
+@pytest.mark.parametrize("call_cost, enabled", [(0.0, True), (0.002, False)])
+def test_region_grabs_fall_back_when_slower(call_cost, enabled):
+    screen = TimedScreen(full_cost=0.004, call_cost=call_cost)
+    capture = RoiCapture(screen, probes=LAYOUT.probe_rects(), min_ticks=5, clock=lambda: 0.0)
+    capture.capture()
+    for _ in range(10):
+        capture.set_rois([LAYOUT.rect(0, 0, 0, 1)])
+        capture.capture()
+    assert capture.enabled is enabled
+    assert (capture.time_ratio < 1.0) is enabled
+    if not enabled:
+        assert capture.roi_grabs == 5 and capture.full_grabs == 6
@@ -0,0 +1,75 @@
+# test_template_matcher.py
+import os
+import shutil
+
+import cv2
+import numpy as np
+import pytest
+
+from layout import GridLayout
+from synthetic_board import BoardRenderer
+from template_matcher import TemplateMatcher, PACKED_SUFFIX
+
+TEMPLATES = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir,
+                         "NIKKE_Tool_AZX-Service_Time", "digits.pkl")
+
+@pytest.fixture(scope="module")
+def templates_file(tmp_path_factory):
+    """Copy of digits.pkl, so the packed sidecar is written next to the copy"""
+    if not os.path.exists(TEMPLATES):
+        pytest.skip("digits.pkl not found")
+    path = str(tmp_path_factory.mktemp("templates") / "digits.pkl")
+    shutil.copy(TEMPLATES, path)
+    return path
+
+@pytest.fixture(scope="module")
+def crops(templates_file):
+    """OCR windows of noisy synthetic boards, with some empty and half-faded cells"""
+    glyphs = TemplateMatcher(templates_file=templates_file, dont_save_unknowns=True, verbose=False).templates
+    renderer = BoardRenderer(glyphs, seed=1)
+    layout = GridLayout(14, 8, (0, 0, 480, 830))
+    crops = []
+    for i in range(10):
+        grid = renderer.random_grid(empty_ratio=0.1)
+        variants = renderer.rng.integers(0, 1000, grid.shape)
+        fade = np.where(renderer.rng.random(grid.shape) < 0.1, 0.6, 1.0).astype(np.float32)
+        gray = cv2.cvtColor(renderer.render(grid, variants, fade=fade, noise=4.0 * (i % 3)), cv2.COLOR_BGR2GRAY)
+        crops += [gray[window] for row in layout.crop_slices for window in row]
+    return crops
+
+def test_packed_scores_stay_close_to_float(templates_file, crops):
+    float_matcher = TemplateMatcher(templates_file=templates_file, dont_save_unknowns=True, verbose=False)
+    packed_matcher = TemplateMatcher(templates_file=templates_file, dont_save_unknowns=True, verbose=False,
+                                     packed=True)
+    a = np.array(float_matcher.recognize_crops_with_score(crops))
+    b = np.array(packed_matcher.recognize_crops_with_score(crops))
+    assert (a[:, 0] != b[:, 0]).mean() <= 0.005
+    delta = b[:, 1] - a[:, 1]
+    assert np.abs(delta).max() <= 0.08
+    # Packed scores may be lower (more re-checks) but hardly make a cell look more certain
+    assert delta.max() <= 0.02
+
+def test_packed_bank_is_built_up_front_and_releases_templates(templates_file):
+    sidecar = os.path.splitext(templates_file)[0] + PACKED_SUFFIX
+    if os.path.exists(sidecar):
+        os.remove(sidecar)
+    matcher = TemplateMatcher(templates_file=templates_file, dont_save_unknowns=True, verbose=False, packed=True)
+    assert os.path.exists(sidecar)
+    assert matcher.templates == {}
+    assert matcher._bank
+
+    # The next start reads the sidecar, and training still sees every template
+    again = TemplateMatcher(templates_file=templates_file, dont_save_unknowns=True, verbose=False, packed=True)
+    assert [e[0] for e in again._bank] == [e[0] for e in matcher._bank]
+    again._ensure_templates()
+    assert sum(len(v) for v in again.templates.values()) > 0
+
+def test_layout_for_keeps_layouts_of_the_same_name_apart(tmp_path):
+    matcher = TemplateMatcher(templates_file=str(tmp_path / "none.pkl"), verbose=False)
+    img = np.zeros((415, 240, 3), dtype=np.uint8)
+    default = GridLayout(14, 8, (720, 220, 480, 830), name="14x8")
+    calibrated = GridLayout(14, 8, (722, 219, 478, 833), name="14x8", crop=(0.1, 0.9, 0.2, 0.8))
+    a = matcher.layout_for(img, default)
+    b = matcher.layout_for(img, calibrated)
+    assert a.crop == default.crop and b.crop == calibrated.crop
+    assert matcher.layout_for(img, default) is a